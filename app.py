@@ -4,16 +4,22 @@ app.py - Streamlit App (ใช้ ffmpeg-python แทน moviepy)
 """
 
 import streamlit as st
-import speech_recognition as sr
-from pydub import AudioSegment
-from pydub.silence import split_on_silence
-import google.generativeai as genai
 import os
-import tempfile
 import time
-import ffmpeg
-import subprocess
-import json
+
+from processor import (
+    DhammaPostCreator,
+    configure_logging,
+    open_llm_cache,
+    open_transcript_cache,
+    spool_to_file,
+)
+from asr import ASR_ENGINES, whisper_available
+from jobs import ACTIVE_STATUSES, JobQueue
+from library import open_talk_library
+from metrics import PipelineMetrics
+
+configure_logging()
 
 # ตั้งค่าหน้าเว็บ
 st.set_page_config(
@@ -34,6 +40,9 @@ if "temp_path" not in st.session_state:
     st.session_state.temp_path = None
 if "uploaded_file_name" not in st.session_state:
     st.session_state.uploaded_file_name = None
+if "job_id" not in st.session_state:
+    # job id อยู่ใน URL ด้วย เพื่อให้รีเฟรชเบราว์เซอร์แล้วกลับมาดูงานเดิมได้
+    st.session_state.job_id = st.query_params.get("job")
 
 # CSS
 st.markdown(
@@ -130,353 +139,153 @@ st.markdown(
 )
 
 
-# ===== CLASS สำหรับประมวลผล =====
-class DhammaPostCreator:
-    def __init__(self, gemini_api_key):
-        self.recognizer = sr.Recognizer()
-        self.recognizer.energy_threshold = 300
-        self.recognizer.dynamic_energy_threshold = True
-        self.recognizer.pause_threshold = 0.8
-
-        genai.configure(api_key=gemini_api_key)
-        self.gemini_model = genai.GenerativeModel("gemini-2.5-flash")
-
-    def extract_audio_from_video_ffmpeg(self, video_file_path, progress_callback=None):
-        """แยกเสียงจากวิดีโอด้วย ffmpeg-python"""
-        if progress_callback:
-            progress_callback("🎬 กำลังแยกเสียงจากวิดีโอ...")
-
-        try:
-            audio_path = video_file_path.rsplit(".", 1)[0] + "_extracted_audio.wav"
-            stream = ffmpeg.input(video_file_path)
-            stream = ffmpeg.output(
-                stream,
-                audio_path,
-                acodec="pcm_s16le",
-                ac=1,
-                ar="16000",
-            )
-            ffmpeg.run(stream, overwrite_output=True, quiet=True)
-
-            if progress_callback:
-                progress_callback("✅ แยกเสียงจากวิดีโอเรียบร้อย")
-
-            return audio_path
-
-        except ffmpeg.Error as e:
-            raise Exception(
-                f"ไม่สามารถแยกเสียงจากวิดีโอได้: {e.stderr.decode() if e.stderr else str(e)}"
-            )
-        except Exception as e:
-            raise Exception(f"ไม่สามารถแยกเสียงจากวิดีโอได้: {e}")
-
-    def get_video_info_ffmpeg(self, video_file_path):
-        """ดึงข้อมูลวิดีโอด้วย ffprobe"""
-        try:
-            probe = ffmpeg.probe(video_file_path)
-            video_info = next(
-                (s for s in probe["streams"] if s["codec_type"] == "video"), None
-            )
-            audio_info = next(
-                (s for s in probe["streams"] if s["codec_type"] == "audio"), None
-            )
-
-            if video_info:
-                duration = float(probe["format"]["duration"])
-                width = int(video_info["width"])
-                height = int(video_info["height"])
-
-                return {
-                    "duration": duration,
-                    "size": (width, height),
-                    "has_audio": audio_info is not None,
-                }
-            return None
-        except Exception as e:
-            return None
-
-    def is_video_file(self, file_path):
-        """ตรวจสอบว่าเป็นไฟล์วิดีโอหรือไม่"""
-        video_extensions = [
-            ".mp4",
-            ".avi",
-            ".mov",
-            ".mkv",
-            ".flv",
-            ".wmv",
-            ".webm",
-            ".m4v",
-        ]
-        file_extension = os.path.splitext(file_path)[1].lower()
-        return file_extension in video_extensions
-
-    def convert_to_wav(self, audio_file_path, progress_callback=None):
-        """แปลงไฟล์เสียงเป็น WAV"""
-        file_extension = os.path.splitext(audio_file_path)[1].lower()
-
-        if file_extension == ".wav":
-            return audio_file_path
-
-        if progress_callback:
-            progress_callback("🔄 กำลังแปลงไฟล์เสียง...")
-
-        audio = AudioSegment.from_file(audio_file_path)
-        audio = audio.set_channels(1)
-        audio = audio.set_frame_rate(16000)
-
-        wav_path = audio_file_path.rsplit(".", 1)[0] + "_converted.wav"
-        audio.export(wav_path, format="wav")
-        return wav_path
-
-    def get_audio_duration(self, audio_file_path):
-        """ตรวจสอบความยาวไฟล์เสียง"""
-        audio = AudioSegment.from_file(audio_file_path)
-        return len(audio) / 1000.0
+# ===== CLASS สำหรับประมวลผล (processor.py) / คิวงาน (jobs.py) =====
+@st.cache_resource
+def get_transcript_cache():
+    """แคช transcript ใช้ร่วมกันทุก session และคงอยู่ข้าม rerun"""
+    return open_transcript_cache()
 
-    def speech_to_text_short(self, audio_file_path, progress_callback=None):
-        """แปลงเสียงสั้น"""
-        if progress_callback:
-            progress_callback("🎤 กำลังแปลงเสียงเป็นข้อความ...")
 
-        with sr.AudioFile(audio_file_path) as source:
-            self.recognizer.adjust_for_ambient_noise(source, duration=0.5)
-            audio_data = self.recognizer.record(source)
+@st.cache_resource
+def get_llm_cache():
+    """แคชคำตอบ Gemini ใช้ร่วมกันทุก session"""
+    return open_llm_cache()
 
-        try:
-            text = self.recognizer.recognize_google(audio_data, language="th-TH")
-            return text
-        except sr.UnknownValueError:
-            raise Exception("ไม่สามารถรู้จำเสียงได้ กรุณาตรวจสอบคุณภาพเสียง")
-        except sr.RequestError as e:
-            raise Exception(f"ไม่สามารถเชื่อมต่อ Google Speech API: {e}")
 
-    def speech_to_text_long(self, audio_file_path, progress_callback=None):
-        """แปลงเสียงยาว แบ่งเป็นส่วนๆ"""
-        if progress_callback:
-            progress_callback("📊 กำลังแบ่งไฟล์เสียงเป็นส่วนๆ...")
+@st.cache_resource
+def get_talk_library():
+    """คลังธรรมะที่ประมวลผลแล้ว (SQLite FTS5) ใช้ร่วมกันทุก session"""
+    return open_talk_library()
 
-        audio = AudioSegment.from_wav(audio_file_path)
-        chunk_length_ms = 30000
-        chunks = []
 
-        for i in range(0, len(audio), chunk_length_ms):
-            chunks.append(audio[i : i + chunk_length_ms])
+@st.cache_resource(max_entries=16)
+def get_processor(api_key, max_workers, asr_engine):
+    """processor 1 ชุดต่อ API key + การตั้งค่า ใช้ซ้ำข้าม rerun และ session
 
-        full_text = []
-        total_chunks = len(chunks)
-
-        for i, chunk in enumerate(chunks, 1):
-            if progress_callback:
-                progress_callback(f"🎤 กำลังประมวลผลส่วนที่ {i}/{total_chunks}...")
-
-            chunk_path = f"temp_chunk_{i}.wav"
-            chunk.export(chunk_path, format="wav")
-
-            try:
-                with sr.AudioFile(chunk_path) as source:
-                    self.recognizer.adjust_for_ambient_noise(source, duration=0.3)
-                    audio_data = self.recognizer.record(source)
+    ใช้ตรวจไฟล์ (probe) ก่อนส่งงานเท่านั้น งานจริงรันใน worker ของ jobs.py
+    ไม่มีใครเรียก metrics.reset() จึงไม่เก็บ metrics
+    ล้างด้วย get_processor.clear() (ปุ่มในแถบด้านข้าง)
+    """
+    return DhammaPostCreator(
+        api_key,
+        max_workers=max_workers,
+        asr_engine=asr_engine,
+        transcript_cache=get_transcript_cache(),
+        llm_cache=get_llm_cache(),
+        record_metrics=False,
+    )
 
-                text = self.recognizer.recognize_google(audio_data, language="th-TH")
-                full_text.append(text)
 
-            except sr.UnknownValueError:
-                pass
-            except Exception as e:
-                st.warning(f"ข้ามส่วนที่ {i}: {e}")
-            finally:
-                if os.path.exists(chunk_path):
-                    os.remove(chunk_path)
+@st.cache_resource
+def get_job_queue():
+    """คิวงาน + worker process pool 1 ชุดต่อ server"""
+    return JobQueue(max_workers=int(os.environ.get("DHAMMA_JOB_WORKERS", "2")))
 
-            time.sleep(0.5)
 
-        return " ".join(full_text)
+def start_job(kind, payload):
+    """ส่งงานเข้าคิวเบื้องหลัง แล้ว rerun เพื่อแสดงสถานะ"""
+    job_id = job_queue.submit(
+        kind,
+        payload,
+        gemini_api_key,
+        settings={"max_workers": max_workers, "asr_engine": asr_engine},
+    )
+    st.session_state.job_id = job_id
+    st.query_params["job"] = job_id
+    st.rerun()
 
-    def speech_to_text_auto(self, audio_file_path, progress_callback=None):
-        """เลือกวิธีแปลงอัตโนมัติ"""
-        duration = self.get_audio_duration(audio_file_path)
 
-        if duration > 60:
-            return self.speech_to_text_long(audio_file_path, progress_callback)
-        else:
-            return self.speech_to_text_short(audio_file_path, progress_callback)
+def clear_job():
+    st.session_state.job_id = None
+    if "job" in st.query_params:
+        del st.query_params["job"]
 
-    def create_dhamma_post(self, transcript, category="ธรรมะ", progress_callback=None):
-        """สร้างโพสต์ธรรมะด้วย Gemini"""
-        if progress_callback:
-            progress_callback("✨ กำลังวิเคราะห์และสร้างโพสต์...")
 
-        prompt = f"""
-คุณเป็นผู้เชี่ยวชาญในการสร้างเนื้อหาธรรมะสำหรับ Social Media
+def show_troubleshooting():
+    with st.expander("ℹ️ วิธีแก้ไข"):
+        st.markdown("""
+        **ปัญหาที่พบบ่อย:**
 
-จากเนื้อหาการสอนธรรมะต่อไปนี้:
-{transcript}
+        1. **ไม่สามารถรู้จำเสียงได้**
+           - ตรวจสอบคุณภาพเสียง
+           - ลดเสียง noise
+           - พูดชัดเจนขึ้น
 
-กรุณาสร้าง social media post ที่:
-1. เริ่มต้นด้วย hook ที่ดึงดูดความสนใจและสัมผัสใจ
-2. สรุปเนื้อหาธรรมะให้กระชับ เข้าใจง่าย และมีคุณค่า
-3. ใช้น้ำเสียงที่อบอุ่น เป็นกันเอง แต่สื่อถึงความลึกซึ้งของธรรมะ
-4. ใช้ emoji ที่เหมาะสม 2-3 ตัว (เช่น 🙏 ✨ 💫 🌟 ☸️)
-5. จบด้วย call-to-action หรือคำถามเพื่อกระตุ้นการไตร่ตรอง
-6. ใส่ hashtags ที่เกี่ยวข้องกับธรรมะ 5-8 อัน
+        2. **API Error**
+           - ตรวจสอบ API Key
+           - ตรวจสอบการเชื่อมต่ออินเทอร์เน็ต
 
-หมวดหมู่: {category}
-น้ำเสียง: สอนธรรมะ อบอุ่น สร้างแรงบันดาลใจ
+        3. **ไฟล์ใหญ่เกินไป**
+           - แบ่งไฟล์เป็นส่วนเล็กลง
+           - ใช้ไฟล์ที่สั้นกว่า 10 นาที
 
-รูปแบบ:
-[Hook ที่สัมผัสใจ]
+        4. **วิดีโอไม่มีเสียง**
+           - ตรวจสอบว่าวิดีโอมี audio track หรือไม่
 
-[เนื้อหาธรรมะที่กระชับและลึกซึ้ง 2-3 ประโยค]
+        5. **ไม่สามารถแยกเสียงจากวิดีโอได้**
+           - ตรวจสอบว่าติดตั้ง ffmpeg แล้วหรือยัง
+        """)
 
-[Call-to-action หรือคำถามเพื่อให้ไตร่ตรอง]
 
-#hashtag1 #hashtag2 #hashtag3 ...
+def show_post_preview(placeholder, text):
+    placeholder.markdown(
+        f"""
+    <div class="post-container">
+    {text.replace(chr(10), "<br>")}
+    </div>
+    """,
+        unsafe_allow_html=True,
+    )
 
-กรุณาสร้างโพสต์ที่สวยงาม เหมาะสำหรับโพสต์บน Facebook, Instagram, หรือ Line
-"""
 
-        try:
-            response = self.gemini_model.generate_content(prompt)
-            post = response.text.strip()
-            return post
-        except Exception as e:
-            raise Exception(f"ไม่สามารถสร้างโพสต์ได้: {e}")
-
-    def create_dhamma_essence(self, transcript, progress_callback=None):
-        """สร้างแก่นธรรม 3 ข้อ และ Headline"""
-        if progress_callback:
-            progress_callback("📝 กำลังสร้างแก่นธรรม 3 ข้อ...")
-
-        prompt = f"""
-จากเนื้อหาธรรมะนี้ ช่วยสรุปเป็น "แก่นธรรม 3 ข้อ"
-เพื่อนำไปทำภาพกราฟิกแบบ Checklist หรือ Carousel
-ขอภาษาที่กระชับ อ่านง่าย เหมือนสรุป Key Takeaway ให้คนอ่าน
-และขอ "พาดหัวเรื่อง" (Headline) ที่น่าสนใจสำหรับโพสต์นี้ด้วย 1 ชื่อ
-
-เนื้อหา:
-{transcript}
-
-กรุณาตอบในรูปแบบ JSON:
-{{
-    "headline": "พาดหัวที่น่าสนใจ",
-    "essence_1": "แก่นธรรมข้อที่ 1",
-    "essence_2": "แก่นธรรมข้อที่ 2",
-    "essence_3": "แก่นธรรมข้อที่ 3",
-    "quote": "คำคมสั้นๆ ที่สรุปใจความสำคัญ"
-}}
-
-เงื่อนไข:
-- Headline: ไม่เกิน 60 ตัวอักษร น่าสนใจ ดึงดูดใจ
-- แก่นธรรมแต่ละข้อ: ไม่เกิน 100 ตัวอักษร กระชับ ชัดเจน
-- Quote: ไม่เกิน 150 ตัวอักษร สั้น กระทบใจ จดจำง่าย
-"""
+def show_library_search():
+    """ค้นหาธรรมะที่เคยประมวลผลแล้ว และเปิดผลลัพธ์เดิมได้โดยไม่ต้องถอดเสียงใหม่"""
+    try:
+        talk_library = get_talk_library()
+        total = talk_library.count()
+    except Exception as e:
+        st.caption(f"⚠️ เปิดคลังธรรมะไม่สำเร็จ: {e}")
+        return
 
-        try:
-            response = self.gemini_model.generate_content(prompt)
-            response_text = (
-                response.text.strip().replace("```json", "").replace("```", "").strip()
+    with st.expander(f"📚 ค้นหาในคลังธรรมะ ({total:,} ไฟล์)"):
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            query = st.text_input(
+                "คำค้น", placeholder="เช่น สติ ปล่อยวาง", key="library_query"
             )
-            result = json.loads(response_text)
-            return result
-        except Exception as e:
-            return {
-                "headline": "หลักธรรมะสำคัญที่ควรรู้",
-                "essence_1": "การฝึกสติในชีวิตประจำวัน",
-                "essence_2": "การปล่อยวางความยึดติด",
-                "essence_3": "การพัฒนาปัญญาเพื่อเข้าใจความจริง",
-                "quote": "ความสุขที่แท้จริงเกิดจากภายใน ไม่ใช่สิ่งภายนอก",
-            }
-
-    def extract_keywords(self, transcript, progress_callback=None):
-        """สกัด keywords จากเนื้อหา"""
-        if progress_callback:
-            progress_callback("🔍 กำลังสกัด keywords...")
-
-        prompt = f"""
-วิเคราะห์เนื้อหาธรรมะต่อไปนี้และสกัด 5-8 keywords ที่สำคัญ:
-
-{transcript}
-
-กรุณาตอบในรูปแบบ JSON:
-{{
-    "keywords": ["keyword1", "keyword2", ...],
-    "main_teaching": "หลักธรรมะหลักที่สอน",
-    "emotion": "อารมณ์/ความรู้สึกที่ต้องการสื่อ"
-}}
-
-keywords ควรเป็น:
-- คำภาษาไทยที่เกี่ยวกับธรรมะ
-- เหมาะสำหรับทำ hashtag
-- สั้น กระชับ มีความหมาย
-"""
+        with col2:
+            only_category = st.checkbox(f"เฉพาะหมวด {category}", key="library_only")
+        if not query.strip():
+            return
 
-        try:
-            response = self.gemini_model.generate_content(prompt)
-            response_text = (
-                response.text.strip().replace("```json", "").replace("```", "").strip()
+        started = time.perf_counter()
+        results = talk_library.search(
+            query, category=category if only_category else None
+        )
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        st.caption(f"พบ {len(results)} รายการ ({elapsed_ms:.0f} ms)")
+
+        for talk in results:
+            created = time.strftime("%d/%m/%Y", time.localtime(talk["created_at"]))
+            st.markdown(
+                f"**{talk['headline'] or talk['file_name']}**  \n"
+                f"📁 {talk['file_name']} · 📂 {talk['category']} · 📅 {created}"
             )
-            result = json.loads(response_text)
-            return result
-        except Exception as e:
-            return {
-                "keywords": ["ธรรมะ", "สติ", "ปัญญา", "สันติสุข"],
-                "main_teaching": "การปฏิบัติธรรม",
-                "emotion": "สงบ สะเทือนใจ",
-            }
-
-    def process_file(self, file_path, category="ธรรมะ", progress_callback=None):
-        """ประมวลผลไฟล์ (เสียงหรือวิดีโอ)"""
-        start_time = time.time()
-        audio_path = file_path
-        extracted_audio = False
-
-        if self.is_video_file(file_path):
-            if progress_callback:
-                progress_callback("🎬 ตรวจพบไฟล์วิดีโอ กำลังแยกเสียง...")
+            st.markdown(talk["snippet"])
+            if st.button("📄 เปิดผลลัพธ์นี้", key=f"library_open_{talk['id']}"):
+                record = talk_library.get(talk["id"])
+                st.session_state.final_result = dict(
+                    record, processing_time=0.0, metrics=[]
+                )
+                st.session_state.uploaded_file_name = record["file_name"]
+                st.session_state.processing_stage = "result"
+                st.rerun()
+            st.markdown("---")
 
-            audio_path = self.extract_audio_from_video_ffmpeg(
-                file_path, progress_callback
-            )
-            extracted_audio = True
-
-        wav_path = self.convert_to_wav(audio_path, progress_callback)
-        transcript = self.speech_to_text_auto(wav_path, progress_callback)
-
-        if not transcript or len(transcript.strip()) < 20:
-            raise Exception("ข้อความที่ได้สั้นเกินไป กรุณาตรวจสอบไฟล์")
-
-        return {
-            "transcript": transcript,
-            "audio_path": audio_path,
-            "wav_path": wav_path,
-            "extracted_audio": extracted_audio,
-            "was_video": self.is_video_file(file_path),
-            "start_time": start_time,
-        }
-
-    def continue_processing(self, transcript, category, progress_callback=None):
-        """ประมวลผลต่อหลังจากแสดง transcript แล้ว"""
-        # สกัด keywords
-        analysis = self.extract_keywords(transcript, progress_callback)
-
-        # สร้างโพสต์
-        post = self.create_dhamma_post(transcript, category, progress_callback)
-
-        # สร้างแก่นธรรม 3 ข้อ
-        essence = self.create_dhamma_essence(transcript, progress_callback)
-
-        return {
-            "post": post,
-            "keywords": analysis.get("keywords", []),
-            "main_teaching": analysis.get("main_teaching", ""),
-            "emotion": analysis.get("emotion", ""),
-            "headline": essence.get("headline", ""),
-            "essence_1": essence.get("essence_1", ""),
-            "essence_2": essence.get("essence_2", ""),
-            "essence_3": essence.get("essence_3", ""),
-            "quote": essence.get("quote", ""),
-        }
 
+transcript_cache = get_transcript_cache()
+llm_cache = get_llm_cache()
+job_queue = get_job_queue()
 
 # ===== SIDEBAR =====
 with st.sidebar:
@@ -514,6 +323,41 @@ with st.sidebar:
 
     st.markdown("---")
 
+    st.markdown("### ⚙️ การประมวลผล")
+    max_workers = st.slider(
+        "จำนวนส่วนที่ถอดเสียงพร้อมกัน",
+        min_value=1,
+        max_value=8,
+        value=4,
+        help="เพิ่มจำนวนเพื่อให้ไฟล์ยาวเสร็จเร็วขึ้น (ถูกจำกัดอัตราเรียก API อัตโนมัติ)",
+    )
+    asr_engine = st.selectbox(
+        "เครื่องถอดเสียง",
+        options=list(ASR_ENGINES),
+        format_func=ASR_ENGINES.get,
+        help="Whisper ถอดเสียงในเครื่อง ไม่ติดโควตา API (ต้องติดตั้ง faster-whisper)",
+    )
+    if asr_engine == "whisper" and not whisper_available():
+        st.warning(
+            "ยังไม่ได้ติดตั้ง faster-whisper กรุณารัน: pip install faster-whisper"
+        )
+
+    cache_col1, cache_col2 = st.columns(2)
+    with cache_col1:
+        st.metric("⚡ แคช hit", transcript_cache.hits)
+        st.metric("⚡ Gemini hit", llm_cache.hits)
+    with cache_col2:
+        st.metric("🐢 แคช miss", transcript_cache.misses)
+        st.metric("🐢 Gemini miss", llm_cache.misses)
+
+    if st.button("♻️ เริ่มการเชื่อมต่อใหม่", use_container_width=True):
+        get_processor.clear()
+        # worker ทิ้ง processor ที่สร้างไว้ก่อนรับงานถัดไป
+        job_queue.reset_processors()
+        st.rerun()
+
+    st.markdown("---")
+
     st.markdown("### 📊 คุณสมบัติ")
     st.markdown("""
     - ✅ รองรับไฟล์เสียง
@@ -566,13 +410,120 @@ if not gemini_api_key:
     """)
     st.stop()
 
-# สร้าง processor
+# processor ที่ใช้ร่วมกัน (สร้างครั้งแรกเท่านั้น ไม่สร้างใหม่ทุก rerun)
 try:
-    processor = DhammaPostCreator(gemini_api_key)
+    processor = get_processor(gemini_api_key, max_workers, asr_engine)
 except Exception as e:
     st.error(f"❌ ไม่สามารถเริ่มระบบได้: {e}")
     st.stop()
 
+# ===== งานเบื้องหลัง: ถามสถานะจนกว่างานจะเสร็จ =====
+if st.session_state.job_id:
+    job = job_queue.get(st.session_state.job_id)
+
+    if job is None:
+        clear_job()
+
+    elif job["status"] in ACTIVE_STATUSES:
+        payload = job["payload"]
+        st.markdown(f"### ⏳ กำลังประมวลผล: {payload.get('file_name', '')}")
+
+        media_info = payload.get("media_info")
+        if media_info and media_info["duration"]:
+            details = (
+                f"- ขนาด: {media_info['size'][0]}x{media_info['size'][1]} pixels"
+                if media_info["has_video"]
+                else f"- เสียง: {media_info['audio_codec']}, "
+                f"{media_info['sample_rate']} Hz, {media_info['channels']} ช่อง"
+            )
+            st.info(f"""
+            📊 **ข้อมูลไฟล์:**
+            - ความยาว: {media_info["duration"]:.1f} วินาที ({media_info["duration"] / 60:.1f} นาที)
+            {details}
+            """)
+
+        st.info(job["progress"] or "📥 รอคิวประมวลผล...")
+        if job["partial_output"]:
+            show_post_preview(st.empty(), job["partial_output"])
+        st.caption("💡 รีเฟรชหรือเปิดหน้านี้ใหม่ได้ ระบบยังประมวลผลต่อเบื้องหลัง")
+
+        # ระหว่าง stream โพสต์ ถามบ่อยขึ้นเพื่อให้ข้อความไหลต่อเนื่อง
+        streaming = job["kind"] == "generate" and job["status"] == "running"
+        time.sleep(0.25 if streaming else 1.0)
+        st.rerun()
+
+    elif job["status"] == "done":
+        payload = job["payload"]
+        clear_job()
+
+        for warning in job["result"].get("warnings", []):
+            st.warning(warning)
+
+        if job["kind"] == "transcribe":
+            st.session_state.initial_result = job["result"]
+            st.session_state.temp_path = payload["file_path"]
+            st.session_state.uploaded_file_name = payload["file_name"]
+            st.session_state.processing_stage = "transcript"
+        else:
+            final_result = job["result"]
+
+            # ลบไฟล์ชั่วคราว
+            if payload.get("file_path") and os.path.exists(payload["file_path"]):
+                try:
+                    os.remove(payload["file_path"])
+                except:
+                    pass
+
+            # คำนวณเวลา จากเวลาประมวลผลจริง (ไม่รวมเวลาที่ผู้ใช้อ่าน transcript)
+            metrics = payload.get("metrics", []) + final_result.get("metrics", [])
+            processing_time = sum(
+                record["wall_seconds"]
+                for record in metrics
+                if record["stage"] in ("transcription", "generation")
+            )
+
+            # รวมผลลัพธ์
+            st.session_state.final_result = {
+                "transcript": payload["transcript"],
+                "post": final_result["post"],
+                "keywords": final_result["keywords"],
+                "main_teaching": final_result["main_teaching"],
+                "emotion": final_result["emotion"],
+                "processing_time": processing_time,
+                "was_video": payload["was_video"],
+                "headline": final_result["headline"],
+                "essence_1": final_result["essence_1"],
+                "essence_2": final_result["essence_2"],
+                "essence_3": final_result["essence_3"],
+                "quote": final_result["quote"],
+                "metrics": metrics,
+            }
+            st.session_state.uploaded_file_name = payload["file_name"]
+            st.session_state.processing_stage = "result"
+
+            # เก็บลงคลังธรรมะ ค้นหาและนำกลับมาใช้ได้โดยไม่ต้องถอดเสียงใหม่
+            try:
+                record = dict(
+                    st.session_state.final_result, duration=payload.get("duration")
+                )
+                get_talk_library().add(
+                    record,
+                    file_name=payload["file_name"],
+                    category=payload["category"],
+                )
+            except Exception as e:
+                st.warning(f"⚠️ บันทึกลงคลังธรรมะไม่สำเร็จ: {e}")
+
+    else:
+        clear_job()
+        st.error(f"❌ เกิดข้อผิดพลาด: {job['error']}")
+
+        if job["kind"] == "transcribe":
+            file_path = job["payload"]["file_path"]
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            show_troubleshooting()
+
 # ===== STAGE 1: UPLOAD =====
 if st.session_state.processing_stage == "upload":
     st.markdown("### 📤 อัปโหลดไฟล์เสียงหรือวิดีโอธรรมะ")
@@ -600,6 +551,9 @@ if st.session_state.processing_stage == "upload":
             unsafe_allow_html=True,
         )
 
+    # ไฟล์ที่เคยประมวลผลแล้ว เปิดจากคลังได้ทันทีโดยไม่ต้องอัปโหลดใหม่
+    show_library_search()
+
     uploaded_file = st.file_uploader(
         "เลือกไฟล์เสียงหรือวิดีโอ",
         type=[
@@ -660,86 +614,35 @@ if st.session_state.processing_stage == "upload":
         st.markdown("---")
 
         if st.button("🚀 เริ่มสร้างโพสต์", type="primary", use_container_width=True):
-            progress_bar = st.progress(0)
-            status_text = st.empty()
-
-            def update_progress(message):
-                status_text.text(message)
-
-            with tempfile.NamedTemporaryFile(
-                delete=False, suffix=os.path.splitext(uploaded_file.name)[1]
-            ) as tmp_file:
-                tmp_file.write(uploaded_file.read())
-                temp_path = tmp_file.name
+            # เขียนลงดิสก์ทีละ block พร้อมคำนวณ hash (ไม่สร้าง bytes ก้อนใหญ่ทั้งไฟล์)
+            uploaded_file.seek(0)
+            temp_path, file_hash = spool_to_file(
+                uploaded_file, suffix=os.path.splitext(uploaded_file.name)[1]
+            )
 
             try:
-                progress_bar.progress(10)
-                update_progress("📂 กำลังโหลดไฟล์...")
-
-                if is_video:
-                    video_info = processor.get_video_info_ffmpeg(temp_path)
-                    if video_info:
-                        st.info(f"""
-                        📊 **ข้อมูลวิดีโอ:**
-                        - ความยาว: {video_info["duration"]:.1f} วินาที ({video_info["duration"] / 60:.1f} นาที)
-                        - ขนาด: {video_info["size"][0]}x{video_info["size"][1]} pixels
-                        - มีเสียง: {"✅ ใช่" if video_info["has_audio"] else "❌ ไม่มี"}
-                        """)
-
-                        if not video_info["has_audio"]:
-                            st.error("❌ วิดีโอนี้ไม่มีเสียง กรุณาอัปโหลดไฟล์ที่มีเสียง")
-                            os.remove(temp_path)
-                            st.stop()
-
-                progress_bar.progress(20)
-
-                initial_result = processor.process_file(
-                    temp_path, category=category, progress_callback=update_progress
+                # อ่านแค่ header (ไม่กี่มิลลิวินาที) ไฟล์ไม่มีเสียง/สั้นเกินไปถูกปฏิเสธทันที
+                media_info = processor.probe_media(temp_path)
+                processor.validate_media(media_info)
+
+                # ถอดเสียงใน worker process: ไม่หายเมื่อ rerun หรือรีเฟรช
+                start_job(
+                    "transcribe",
+                    {
+                        "file_path": temp_path,
+                        "file_hash": file_hash,
+                        "file_name": uploaded_file.name,
+                        "category": category,
+                        "media_info": media_info,
+                    },
                 )
 
-                progress_bar.progress(60)
-                status_text.empty()
-                progress_bar.empty()
-
-                # บันทึกใน session state
-                st.session_state.initial_result = initial_result
-                st.session_state.temp_path = temp_path
-                st.session_state.uploaded_file_name = uploaded_file.name
-                st.session_state.processing_stage = "transcript"
-                st.rerun()
-
             except Exception as e:
-                progress_bar.empty()
-                status_text.empty()
-
                 if os.path.exists(temp_path):
                     os.remove(temp_path)
 
                 st.error(f"❌ เกิดข้อผิดพลาด: {e}")
-
-                with st.expander("ℹ️ วิธีแก้ไข"):
-                    st.markdown("""
-                    **ปัญหาที่พบบ่อย:**
-
-                    1. **ไม่สามารถรู้จำเสียงได้**
-                       - ตรวจสอบคุณภาพเสียง
-                       - ลดเสียง noise
-                       - พูดชัดเจนขึ้น
-
-                    2. **API Error**
-                       - ตรวจสอบ API Key
-                       - ตรวจสอบการเชื่อมต่ออินเทอร์เน็ต
-
-                    3. **ไฟล์ใหญ่เกินไป**
-                       - แบ่งไฟล์เป็นส่วนเล็กลง
-                       - ใช้ไฟล์ที่สั้นกว่า 10 นาที
-
-                    4. **วิดีโอไม่มีเสียง**
-                       - ตรวจสอบว่าวิดีโอมี audio track หรือไม่
-
-                    5. **ไม่สามารถแยกเสียงจากวิดีโอได้**
-                       - ตรวจสอบว่าติดตั้ง ffmpeg แล้วหรือยัง
-                    """)
+                show_troubleshooting()
 
     else:
         # แสดงตัวอย่าง
@@ -901,27 +804,8 @@ elif st.session_state.processing_stage == "transcript":
                 except:
                     pass
 
-            # ลบไฟล์เสียงที่แยกจากวิดีโอ
-            if initial_result.get("extracted_audio") and initial_result.get(
-                "audio_path"
-            ):
-                if os.path.exists(initial_result["audio_path"]):
-                    try:
-                        os.remove(initial_result["audio_path"])
-                    except:
-                        pass
-
-            # ลบไฟล์ wav ที่แปลงแล้ว
-            if initial_result.get("wav_path") and initial_result["wav_path"].endswith(
-                "_converted.wav"
-            ):
-                if os.path.exists(initial_result["wav_path"]):
-                    try:
-                        os.remove(initial_result["wav_path"])
-                    except:
-                        pass
-
             # Reset session state
+            clear_job()
             st.session_state.processing_stage = "upload"
             st.session_state.initial_result = None
             st.session_state.temp_path = None
@@ -934,79 +818,19 @@ elif st.session_state.processing_stage == "transcript":
             type="primary",
             use_container_width=True,
         ):
-            progress_bar = st.progress(60)
-            status_text = st.empty()
-
-            def update_progress(message):
-                status_text.text(message)
-
-            try:
-                progress_bar.progress(70)
-                final_result = processor.continue_processing(
-                    initial_result["transcript"],
-                    category=category,
-                    progress_callback=update_progress,
-                )
-
-                progress_bar.progress(100)
-                status_text.empty()
-                progress_bar.empty()
-
-                # ลบไฟล์ชั่วคราว
-                if st.session_state.temp_path and os.path.exists(
-                    st.session_state.temp_path
-                ):
-                    try:
-                        os.remove(st.session_state.temp_path)
-                    except:
-                        pass
-
-                if initial_result.get("extracted_audio") and initial_result.get(
-                    "audio_path"
-                ):
-                    if os.path.exists(initial_result["audio_path"]):
-                        try:
-                            os.remove(initial_result["audio_path"])
-                        except:
-                            pass
-
-                if initial_result.get("wav_path") and initial_result[
-                    "wav_path"
-                ].endswith("_converted.wav"):
-                    if os.path.exists(initial_result["wav_path"]):
-                        try:
-                            os.remove(initial_result["wav_path"])
-                        except:
-                            pass
-
-                # คำนวณเวลา
-                processing_time = time.time() - initial_result["start_time"]
-
-                # รวมผลลัพธ์
-                result = {
+            start_job(
+                "generate",
+                {
                     "transcript": initial_result["transcript"],
-                    "post": final_result["post"],
-                    "keywords": final_result["keywords"],
-                    "main_teaching": final_result["main_teaching"],
-                    "emotion": final_result["emotion"],
-                    "processing_time": processing_time,
+                    "category": category,
+                    "file_path": st.session_state.temp_path,
+                    "file_name": st.session_state.uploaded_file_name,
                     "was_video": initial_result["was_video"],
-                    "headline": final_result["headline"],
-                    "essence_1": final_result["essence_1"],
-                    "essence_2": final_result["essence_2"],
-                    "essence_3": final_result["essence_3"],
-                    "quote": final_result["quote"],
-                }
-
-                # เก็บผลลัพธ์ใน session state
-                st.session_state.final_result = result
-                st.session_state.processing_stage = "result"
-                st.rerun()
-
-            except Exception as e:
-                progress_bar.empty()
-                status_text.empty()
-                st.error(f"❌ เกิดข้อผิดพลาด: {e}")
+                    "duration": initial_result["duration"],
+                    "start_time": initial_result["start_time"],
+                    "metrics": initial_result.get("metrics", []),
+                },
+            )
 
     with col3:
         pass  # ว่างไว้เพื่อ spacing
@@ -1029,12 +853,13 @@ elif st.session_state.processing_stage == "result":
     st.markdown("---")
 
     # แท็บต่างๆ
-    tab1, tab2, tab3, tab4 = st.tabs(
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(
         [
             "📱 โพสต์ Social Media",
             "🎨 แก่นธรรม 3 ข้อ & Quote",
             "📝 Transcript",
             "🔍 การวิเคราะห์",
+            "⏱️ ประสิทธิภาพ",
         ]
     )
 
@@ -1275,10 +1100,63 @@ elif st.session_state.processing_stage == "result":
             tags = len(result["keywords"])
             st.metric("Keywords", tags)
 
+    with tab5:
+        st.markdown("### ⏱️ เวลาและทรัพยากรแต่ละขั้นตอน")
+
+        pipeline_metrics = PipelineMetrics(result.get("metrics"))
+        summary = pipeline_metrics.summary()
+
+        if not summary:
+            st.info("ไม่มีข้อมูลการวัดผลสำหรับงานนี้")
+        else:
+            st.dataframe(
+                [
+                    {
+                        "ขั้นตอน": row["stage"],
+                        "จำนวนครั้ง": row["count"],
+                        "เวลาจริง (วินาที)": round(row["wall_seconds"], 2),
+                        "CPU (วินาที)": round(row["cpu_seconds"], 2),
+                        "ข้อมูล (MB)": round(row["bytes"] / 1024 / 1024, 2),
+                        "ลองใหม่": row["retries"],
+                        "ผิดพลาด": row["errors"],
+                        "RAM (MB)": round(row["rss_bytes"] / 1024 / 1024),
+                        "RAM เพิ่มขึ้น (MB)": round(
+                            row["rss_growth_bytes"] / 1024 / 1024
+                        ),
+                    }
+                    for row in summary
+                ],
+                use_container_width=True,
+                hide_index=True,
+            )
+            st.caption(
+                "เวลาของ asr_chunk และ gemini เป็นผลรวมของทุก thread "
+                "จึงอาจมากกว่าเวลาจริงของทั้งงาน RAM วัดตอนเริ่ม/จบแต่ละขั้นตอน"
+            )
+
+            col1, col2 = st.columns(2)
+            with col1:
+                st.download_button(
+                    label="💾 ดาวน์โหลด (JSON lines)",
+                    data=pipeline_metrics.to_jsonl(),
+                    file_name=f"metrics_{st.session_state.uploaded_file_name}.jsonl",
+                    mime="application/x-ndjson",
+                    use_container_width=True,
+                )
+            with col2:
+                st.download_button(
+                    label="💾 ดาวน์โหลด (Prometheus)",
+                    data=pipeline_metrics.to_prometheus(),
+                    file_name=f"metrics_{st.session_state.uploaded_file_name}.prom",
+                    mime="text/plain",
+                    use_container_width=True,
+                )
+
     # ปุ่มเริ่มใหม่
     st.markdown("---")
     if st.button("🔄 ประมวลผลไฟล์ใหม่", use_container_width=True):
         # Reset session state
+        clear_job()
         st.session_state.processing_stage = "upload"
         st.session_state.initial_result = None
         st.session_state.final_result = None
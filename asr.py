@@ -0,0 +1,184 @@
+"""
+asr.py - เครื่องถอดเสียง (speech-to-text) ที่สลับกันได้
+
+- "google": Google Web Speech API ผ่าน SpeechRecognition (ต้องใช้เน็ต ถูกจำกัดอัตรา)
+- "whisper": faster-whisper ถอดในเครื่องด้วย CPU ถอดหลายส่วนพร้อมกันแบบ batch
+  (ไม่บังคับ ต้องติดตั้งเพิ่ม: pip install faster-whisper)
+
+ทุกตัวมี recognize(audio_data) และ recognize_batch(list) ที่คืนข้อความ
+หรือ None ถ้าไม่ได้ยินคำพูด
+"""
+
+import bisect
+import importlib.util
+import threading
+
+from lazy import LazyModule
+
+sr = LazyModule("speech_recognition")
+
+ASR_ENGINES = {
+    "google": "☁️ Google (ออนไลน์)",
+    "whisper": "💻 Whisper (ในเครื่อง)",
+}
+
+# โมเดล Whisper ใช้เวลาโหลดนาน จึงโหลดครั้งเดียวต่อ process แล้วใช้ซ้ำ
+_whisper_models = {}
+_whisper_lock = threading.Lock()
+
+
+def whisper_available():
+    """ติดตั้ง faster-whisper แล้วหรือไม่ (ไม่ import จริง)"""
+    return importlib.util.find_spec("faster_whisper") is not None
+
+
+class GoogleWebRecognizer:
+    """Google Web Speech API เรียกทีละส่วน ต้องผ่าน rate limiter"""
+
+    name = "google"
+    rate_limited = True
+    batch_size = 1
+
+    def __init__(self, language="th-TH"):
+        self.language = language
+        # สร้าง sr.Recognizer เมื่อถอดครั้งแรก (import speech_recognition เมื่อใช้จริง)
+        self._recognizer = None
+        self._lock = threading.Lock()
+
+    @property
+    def recognizer(self):
+        with self._lock:
+            if self._recognizer is None:
+                recognizer = sr.Recognizer()
+                recognizer.energy_threshold = 300
+                recognizer.dynamic_energy_threshold = True
+                recognizer.pause_threshold = 0.8
+                self._recognizer = recognizer
+            return self._recognizer
+
+    def settings(self):
+        return {"engine": self.name, "language": self.language}
+
+    def recognize(self, audio_data):
+        try:
+            return self.recognizer.recognize_google(audio_data, language=self.language)
+        except sr.UnknownValueError:
+            return None
+
+    def recognize_batch(self, audio_list):
+        return [self.recognize(audio_data) for audio_data in audio_list]
+
+
+class WhisperRecognizer:
+    """faster-whisper บน CPU ไม่ติดโควตา ความเร็วขึ้นกับจำนวน core ของเครื่อง
+
+    recognize_batch ต่อเสียงหลายส่วนเป็นไฟล์เดียวแล้วถอดด้วย BatchedInferencePipeline
+    โดยให้แต่ละส่วนเป็น clip แยก (โมเดลรับได้ครั้งละไม่เกิน 30 วินาที)
+    """
+
+    name = "whisper"
+    rate_limited = False
+    SAMPLE_RATE = 16000
+    MAX_CLIP_SECONDS = 30
+
+    def __init__(
+        self,
+        model_size="small",
+        language="th",
+        batch_size=8,
+        compute_type="int8",
+        num_workers=1,
+    ):
+        if not whisper_available():
+            raise Exception(
+                "ยังไม่ได้ติดตั้ง faster-whisper กรุณารัน: pip install faster-whisper"
+            )
+        self.model_size = model_size
+        self.language = language
+        self.batch_size = batch_size
+        self.compute_type = compute_type
+        self.num_workers = num_workers
+
+    def _load(self):
+        """โหลดโมเดลเมื่อถอดครั้งแรก คืน (WhisperModel, BatchedInferencePipeline)"""
+        key = (self.model_size, self.compute_type, self.num_workers)
+        with _whisper_lock:
+            if key not in _whisper_models:
+                from faster_whisper import BatchedInferencePipeline, WhisperModel
+
+                # num_workers > 1 ให้หลาย thread เรียก transcribe พร้อมกันได้
+                model = WhisperModel(
+                    self.model_size,
+                    device="cpu",
+                    compute_type=self.compute_type,
+                    num_workers=self.num_workers,
+                )
+                _whisper_models[key] = (model, BatchedInferencePipeline(model=model))
+            return _whisper_models[key]
+
+    def settings(self):
+        return {
+            "engine": self.name,
+            "language": self.language,
+            "model": self.model_size,
+        }
+
+    def _samples(self, audio_data):
+        import numpy as np
+
+        raw = audio_data.get_raw_data(convert_rate=self.SAMPLE_RATE, convert_width=2)
+        return np.frombuffer(raw, dtype=np.int16).astype(np.float32) / 32768.0
+
+    def recognize(self, audio_data):
+        model, _ = self._load()
+        segments, _ = model.transcribe(
+            self._samples(audio_data), language=self.language, vad_filter=False
+        )
+        text = " ".join(segment.text.strip() for segment in segments).strip()
+        return text or None
+
+    def recognize_batch(self, audio_list):
+        import numpy as np
+
+        if len(audio_list) == 1:
+            return [self.recognize(audio_list[0])]
+
+        arrays = [self._samples(audio_data) for audio_data in audio_list]
+        clips = []
+        owners = []
+        offsets = []
+        offset = 0.0
+        for i, samples in enumerate(arrays):
+            seconds = len(samples) / self.SAMPLE_RATE
+            start = 0.0
+            while start < seconds:
+                end = min(seconds, start + self.MAX_CLIP_SECONDS)
+                clips.append({"start": offset + start, "end": offset + end})
+                owners.append(i)
+                offsets.append(offset + start)
+                start = end
+            offset += seconds
+
+        _, pipeline = self._load()
+        segments, _ = pipeline.transcribe(
+            np.concatenate(arrays),
+            language=self.language,
+            vad_filter=False,
+            clip_timestamps=clips,
+            batch_size=self.batch_size,
+        )
+
+        # คืนข้อความให้ส่วนเดิมตามเวลากึ่งกลางของแต่ละ segment
+        texts = [[] for _ in audio_list]
+        for segment in segments:
+            clip = bisect.bisect_right(offsets, (segment.start + segment.end) / 2) - 1
+            texts[owners[max(clip, 0)]].append(segment.text.strip())
+        return [" ".join(parts).strip() or None for parts in texts]
+
+
+def make_recognizer(engine="google", whisper_model="small", num_workers=1):
+    if engine == "google":
+        return GoogleWebRecognizer()
+    if engine == "whisper":
+        return WhisperRecognizer(model_size=whisper_model, num_workers=num_workers)
+    raise Exception(f"ไม่รู้จักเครื่องถอดเสียง: {engine}")
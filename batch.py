@@ -0,0 +1,248 @@
+"""
+batch.py - ประมวลผลไฟล์ธรรมะจำนวนมากแบบไม่มี UI (ทั้งโฟลเดอร์หรือจาก manifest)
+
+ตัวอย่าง:
+    python batch.py /data/sermons --output results.jsonl --workers 4
+    python batch.py manifest.jsonl --output results.jsonl --category วิปัสสนา
+
+ผลลัพธ์เขียนเป็น JSONL ทีละไฟล์ และไฟล์ที่เสร็จแล้วถูกบันทึกใน checkpoint
+รันคำสั่งเดิมซ้ำจะข้ามไฟล์ที่เสร็จแล้ว (ไฟล์ที่ล้มเหลวจะถูกลองใหม่)
+ไฟล์ที่เสร็จถูกเก็บลงคลังธรรมะ (library.py) ให้ค้นหาจากแอปได้ด้วย (ปิดด้วย --no-library)
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from asr import ASR_ENGINES
+from library import open_talk_library
+from processor import (
+    AUDIO_EXTENSIONS,
+    VIDEO_EXTENSIONS,
+    DhammaPostCreator,
+    configure_logging,
+    open_checkpoint_store,
+    open_llm_cache,
+    open_transcript_cache,
+)
+
+DEFAULT_CATEGORY = "ธรรมะทั่วไป"
+
+
+def collect_inputs(source, default_category):
+    """คืน list ของ (path, category) จากโฟลเดอร์ หรือ manifest (.jsonl / .txt)"""
+    if os.path.isdir(source):
+        extensions = AUDIO_EXTENSIONS + VIDEO_EXTENSIONS
+        inputs = []
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                if os.path.splitext(name)[1].lower() in extensions:
+                    path = os.path.abspath(os.path.join(root, name))
+                    inputs.append((path, default_category))
+        return sorted(inputs)
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    inputs = []
+    with open(source, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+
+            if source.endswith(".jsonl"):
+                entry = json.loads(line)
+                path = entry["path"]
+                category = entry.get("category", default_category)
+            else:
+                path, category = line, default_category
+
+            # path เต็มแบบเดียวกับโฟลเดอร์ checkpoint จึงจับคู่ได้ทุกครั้ง
+            inputs.append((os.path.abspath(os.path.join(base_dir, path)), category))
+    return inputs
+
+
+def load_checkpoint(checkpoint_path):
+    if not os.path.exists(checkpoint_path):
+        return set()
+    with open(checkpoint_path, encoding="utf-8") as f:
+        return {line.rstrip("\n") for line in f if line.strip()}
+
+
+def process_one(file_path, category, api_key, settings):
+    """ถอดเสียง + สร้างโพสต์ 1 ไฟล์ (รันใน worker process)"""
+    started = time.time()
+    record = {"path": file_path, "category": category}
+
+    try:
+        processor = DhammaPostCreator(
+            api_key,
+            transcript_cache=open_transcript_cache(),
+            llm_cache=open_llm_cache(),
+            checkpoint_store=open_checkpoint_store(),
+            **settings,
+        )
+        initial_result = processor.process_file(file_path, category=category)
+        final_result = processor.continue_processing(
+            initial_result["transcript"], category
+        )
+
+        record.update(
+            status="done",
+            duration=initial_result["duration"],
+            was_video=initial_result["was_video"],
+            transcript=initial_result["transcript"],
+            **final_result,
+        )
+        record["metrics"] = initial_result["metrics"] + final_result["metrics"]
+    except Exception as e:
+        record.update(status="failed", error=str(e))
+
+    record["elapsed"] = time.time() - started
+    return record
+
+
+def format_throughput(done, audio_seconds, elapsed):
+    hours = max(elapsed, 1e-9) / 3600
+    return (
+        f"{done / hours:.1f} ไฟล์/ชั่วโมง, "
+        f"{audio_seconds / 3600 / hours:.2f} ชั่วโมงเสียง/ชั่วโมง"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="ประมวลผลไฟล์เสียง/วิดีโอธรรมะจำนวนมาก แล้วเขียนผลลัพธ์เป็น JSONL"
+    )
+    parser.add_argument("source", help="โฟลเดอร์ หรือ manifest (.txt / .jsonl)")
+    parser.add_argument("--output", default="results.jsonl", help="ไฟล์ผลลัพธ์ JSONL")
+    parser.add_argument(
+        "--checkpoint",
+        help="ไฟล์ checkpoint (ค่าเริ่มต้น: <output>.checkpoint)",
+    )
+    parser.add_argument("--category", default=DEFAULT_CATEGORY)
+    parser.add_argument("--workers", type=int, default=2, help="จำนวน process")
+    parser.add_argument(
+        "--chunk-workers",
+        type=int,
+        default=4,
+        help="จำนวนส่วนที่ถอดเสียงพร้อมกันต่อไฟล์",
+    )
+    parser.add_argument(
+        "--requests-per-second",
+        type=float,
+        default=2.0,
+        help="อัตราเรียก API สูงสุดรวมทุก process (แบ่งเท่าๆ กันให้แต่ละ worker)",
+    )
+    parser.add_argument(
+        "--asr-engine", choices=list(ASR_ENGINES), default="google"
+    )
+    parser.add_argument(
+        "--whisper-model", default="small", help="ขนาดโมเดล faster-whisper"
+    )
+    parser.add_argument(
+        "--api-key",
+        default=os.environ.get("GEMINI_API_KEY"),
+        help="Gemini API Key (หรือตั้ง GEMINI_API_KEY)",
+    )
+    parser.add_argument(
+        "--no-library", action="store_true", help="ไม่ต้องเก็บผลลงคลังธรรมะ"
+    )
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    if not args.api_key:
+        parser.error("กรุณาระบุ --api-key หรือตั้งค่า GEMINI_API_KEY")
+
+    checkpoint_path = args.checkpoint or f"{args.output}.checkpoint"
+    completed = load_checkpoint(checkpoint_path)
+    inputs = [
+        (path, category)
+        for path, category in collect_inputs(args.source, args.category)
+        if path not in completed
+    ]
+    print(
+        f"พบ {len(inputs) + len(completed)} ไฟล์ "
+        f"(เสร็จแล้ว {len(completed)}, ต้องประมวลผล {len(inputs)})",
+        file=sys.stderr,
+    )
+
+    # แต่ละ worker มี TokenBucket ของตัวเอง จึงแบ่งอัตรารวมตามจำนวน worker
+    settings = {
+        "max_workers": args.chunk_workers,
+        "requests_per_second": args.requests_per_second / max(1, args.workers),
+        "asr_engine": args.asr_engine,
+        "whisper_model": args.whisper_model,
+    }
+    library = None if args.no_library else open_talk_library()
+    started = time.time()
+    done = failed = 0
+    audio_seconds = 0.0
+
+    with open(args.output, "a", encoding="utf-8") as output, open(
+        checkpoint_path, "a", encoding="utf-8"
+    ) as checkpoint, ProcessPoolExecutor(
+        max_workers=args.workers, initializer=configure_logging
+    ) as executor:
+        futures = {}
+        for path, category in inputs:
+            future = executor.submit(
+                process_one, path, category, args.api_key, settings
+            )
+            futures[future] = (path, category)
+
+        # เขียนผลจาก process หลักเท่านั้น จึงไม่ต้องล็อกไฟล์
+        for future in as_completed(futures):
+            try:
+                record = future.result()
+            except Exception as e:
+                # worker ตาย (เช่น หน่วยความจำไม่พอ) ทำให้งานที่เหลือใน pool
+                # ล้มด้วย BrokenProcessPool ทั้งหมด บันทึกเป็น failed ให้รันซ้ำได้
+                path, category = futures[future]
+                record = {
+                    "path": path,
+                    "category": category,
+                    "status": "failed",
+                    "error": f"worker หยุดทำงานกะทันหัน: {e}",
+                    "elapsed": 0.0,
+                }
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+
+            if record["status"] == "done":
+                done += 1
+                audio_seconds += record.get("duration") or 0.0
+                checkpoint.write(record["path"] + "\n")
+                checkpoint.flush()
+                if library is not None:
+                    try:
+                        library.add(
+                            record,
+                            file_name=os.path.basename(record["path"]),
+                            category=record["category"],
+                        )
+                    except Exception as e:
+                        print(f"บันทึกลงคลังธรรมะไม่สำเร็จ: {e}", file=sys.stderr)
+            else:
+                failed += 1
+
+            print(
+                f"[{done + failed}/{len(inputs)}] {record['status']}: "
+                f"{record['path']} ({record['elapsed']:.1f}s) | "
+                f"{format_throughput(done, audio_seconds, time.time() - started)}",
+                file=sys.stderr,
+            )
+
+    elapsed = time.time() - started
+    print(
+        f"เสร็จ {done} ไฟล์, ล้มเหลว {failed} ไฟล์, ใช้เวลา {elapsed:.1f} วินาที | "
+        f"{format_throughput(done, audio_seconds, elapsed)}",
+        file=sys.stderr,
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
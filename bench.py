@@ -0,0 +1,465 @@
+"""
+bench.py - วัดประสิทธิภาพ DhammaPostCreator ตั้งแต่ต้นจนจบ โดยไม่เรียกบริการของ Google
+
+ใช้ไฟล์เสียง/วิดีโอสังเคราะห์ (สร้างด้วย ffmpeg: เสียง tone สลับช่วงเงียบ + noise)
+ความยาว 1, 10, 60 นาที และ recognizer / Gemini จำลองที่กำหนด latency ได้
+รายงานเวลา throughput และหน่วยความจำของแต่ละขั้นตอน
+
+ตัวอย่าง:
+    python bench.py
+    python bench.py --minutes 1 10 --kinds audio --save baseline.json
+    python bench.py --baseline baseline.json --tolerance 0.2
+    python bench.py --imports --import-budget-ms 150
+    python bench.py --library 20000 --search-budget-ms 100
+
+ทุกกรณีรันใน process ใหม่ ค่า RAM สูงสุด (แถว total) จึงเป็นของกรณีนั้นเท่านั้น
+แถวของแต่ละขั้นตอนแสดง RSS ที่วัดตอนเริ่ม/จบขั้นตอน
+ถ้าระบุ --baseline และขั้นตอนใดช้ากว่า baseline เกิน tolerance จะจบด้วย exit code 1
+
+--imports วัดเวลา import ของโมดูลที่ app.py ใช้ตอนเริ่ม (python -X importtime)
+จบด้วย exit code 1 ถ้าเกินงบเวลา หรือมีไลบรารีหนัก (lazy.HEAVY_MODULES) ถูกโหลด
+
+--library วัดเวลาค้นหาในคลังธรรมะสังเคราะห์ N ไฟล์ (สร้างครั้งแรกแล้วใช้ซ้ำ)
+จบด้วย exit code 1 ถ้าเวลาค้นหา p95 ของคำค้นใดเกินงบ
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import subprocess
+import statistics
+from concurrent.futures import ProcessPoolExecutor
+
+from lazy import HEAVY_MODULES, LazyModule
+from library import TalkLibrary
+from metrics import PipelineMetrics, peak_rss_bytes
+from processor import CACHE_DIR, DhammaPostCreator
+
+ffmpeg = LazyModule("ffmpeg")
+
+FIXTURE_DIR = os.path.join(CACHE_DIR, "bench")
+FIXTURE_EXTENSIONS = {"audio": ".mp3", "video": ".mp4"}
+
+# โมดูลของโปรเจกต์ที่ app.py import ก่อนแสดงหน้าแรก (ไม่รวม streamlit)
+APP_MODULES = ("processor", "jobs", "asr", "metrics", "lazy", "library")
+
+# ขั้นตอนที่ใช้ตรวจ regression (เวลารวมของทั้งขั้นตอน)
+GUARDED_STAGES = ("transcription", "extraction", "conversion", "chunking", "generation")
+
+MOCK_SENTENCE = "การมีสติอยู่กับปัจจุบันทำให้ใจสงบ "
+MOCK_RESULT = {
+    "post": MOCK_SENTENCE * 20,
+    "headline": "สติคือหัวใจของการปฏิบัติ",
+    "essence_1": "รู้ตัวทั่วพร้อม",
+    "essence_2": "ปล่อยวางความคิดปรุงแต่ง",
+    "essence_3": "เมตตาต่อตนเองและผู้อื่น",
+    "quote": "ใจที่สงบคือบ้านที่แท้จริง",
+    "keywords": ["สติ", "สมาธิ", "ปัญญา", "ปล่อยวาง", "เมตตา"],
+    "main_teaching": "สติปัฏฐาน",
+    "emotion": "สงบ",
+}
+
+# คำในคลังสังเคราะห์ เรียงจากพบบ่อยไปพบน้อย (ความถี่แบบ Zipf เหมือนภาษาจริง)
+LIBRARY_WORDS = (
+    "การ ความ ที่ ใจ จิต ธรรม สติ ชีวิต ทุกข์ สุข ปัจจุบัน ปล่อยวาง สมาธิ ปัญญา "
+    "ศีล เมตตา กรุณา กรรม ภาวนา ลมหายใจ ความคิด อารมณ์ ความโกรธ ความอยาก "
+    "อนิจจัง อนัตตา วิปัสสนา นิพพาน อริยสัจ มรรค ขันธ์ เวทนา สัญญา สังขาร วิญญาณ"
+).split()
+LIBRARY_QUERIES = ("สติ", "ปล่อยวาง", "ความโกรธ ลมหายใจ", "อนัตตาวิปัสสนา", "จิต")
+
+
+def make_library(talks, fixture_dir=FIXTURE_DIR, transcript_words=2000, seed=0):
+    """คลังสังเคราะห์ talks ไฟล์ (สร้างครั้งเดียว ใช้ซ้ำถ้ามีอยู่แล้ว)"""
+    path = os.path.join(fixture_dir, f"library_{talks}.sqlite3")
+    library = TalkLibrary(path)
+    if library.count() >= talks:
+        return library
+
+    rng = random.Random(seed)
+    weights = [1 / rank for rank in range(1, len(LIBRARY_WORDS) + 1)]
+
+    def text(words):
+        return "".join(rng.choices(LIBRARY_WORDS, weights, k=words))
+
+    # เขียนใน transaction เดียว (library.add เปิด connection และ commit ทีละไฟล์)
+    with library._db() as db:
+        for i in range(library.count(), talks):
+            db.execute(
+                "INSERT INTO talks (talk_key, file_name, category, created_at, "
+                "headline, main_teaching, keywords, post, transcript) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    str(i),
+                    f"talk_{i}.mp3",
+                    "ธรรมะทั่วไป",
+                    time.time(),
+                    text(6),
+                    text(2),
+                    ", ".join(rng.sample(LIBRARY_WORDS, 5)),
+                    text(150),
+                    text(transcript_words),
+                ),
+            )
+    return library
+
+
+def report_library(talks, budget_ms, fixture_dir=FIXTURE_DIR, repeats=10):
+    """พิมพ์เวลาค้นหาของแต่ละคำค้น คืน True ถ้า p95 ทุกคำค้นอยู่ในงบ"""
+    print(f"กำลังเตรียมคลังสังเคราะห์ {talks} ไฟล์ ...", file=sys.stderr)
+    library = make_library(talks, fixture_dir)
+    size_mb = os.path.getsize(library.path) / 1024 / 1024
+
+    print(f"{'query':<24} {'hits':>5} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+    ok = True
+    for query in LIBRARY_QUERIES:
+        timings = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            hits = len(library.search(query))
+            timings.append((time.perf_counter() - started) * 1000)
+        p95 = statistics.quantiles(timings, n=20)[-1]
+        ok = ok and p95 <= budget_ms
+        print(
+            f"{query:<24} {hits:>5} {statistics.median(timings):>8.1f} "
+            f"{p95:>8.1f} {max(timings):>8.1f}"
+        )
+    print(
+        f"\nคลัง {library.count()} ไฟล์ ({size_mb:.0f} MB), "
+        f"งบ p95 {budget_ms:.0f} ms"
+    )
+    return ok
+
+
+def fixture_path(kind, minutes, fixture_dir=FIXTURE_DIR):
+    return os.path.join(fixture_dir, f"speech_{minutes}m{FIXTURE_EXTENSIONS[kind]}")
+
+
+def make_fixture(kind, minutes, fixture_dir=FIXTURE_DIR):
+    """สร้างไฟล์ทดสอบ (ถ้ายังไม่มี) เสียงพูด 3 วินาที สลับเงียบ 1 วินาที
+
+    ใช้ tone ที่เปลี่ยนความถี่ + pink noise เบาๆ เพื่อให้การแบ่งตามช่วงเงียบทำงานจริง
+    """
+    path = fixture_path(kind, minutes, fixture_dir)
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(fixture_dir, exist_ok=True)
+    seconds = minutes * 60
+    tone = ffmpeg.input(
+        "aevalsrc='0.6*lt(mod(t,4),3)*sin(2*PI*(180+40*sin(2*PI*t/3))*t)'"
+        f":s=44100:d={seconds}",
+        f="lavfi",
+    )
+    noise = ffmpeg.input(
+        f"anoisesrc=color=pink:amplitude=0.005:sample_rate=44100:duration={seconds}",
+        f="lavfi",
+    )
+    audio = ffmpeg.filter([tone, noise], "amix", inputs=2, duration="shortest")
+
+    tmp_path = path + ".tmp" + FIXTURE_EXTENSIONS[kind]
+    try:
+        if kind == "video":
+            video = ffmpeg.input(
+                f"testsrc=size=320x240:rate=5:duration={seconds}", f="lavfi"
+            )
+            stream = ffmpeg.output(
+                video,
+                audio,
+                tmp_path,
+                vcodec="libx264",
+                preset="ultrafast",
+                acodec="aac",
+                ac=2,
+                shortest=None,
+            )
+        else:
+            stream = ffmpeg.output(audio, tmp_path, acodec="libmp3lame", ac=2)
+        ffmpeg.run(
+            stream, overwrite_output=True, capture_stdout=True, capture_stderr=True
+        )
+    except ffmpeg.Error as e:
+        raise Exception(
+            f"สร้างไฟล์ทดสอบไม่สำเร็จ: {e.stderr.decode() if e.stderr else str(e)}"
+        )
+    os.replace(tmp_path, path)
+    return path
+
+
+class MockRecognizer:
+    """แทน backend ใน asr.py: หน่วงเวลาแล้วคืนข้อความยาวตามความยาวเสียง"""
+
+    name = "mock"
+    rate_limited = True
+    batch_size = 1
+
+    def __init__(self, latency, jitter=0.0, chars_per_second=12, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.chars_per_second = chars_per_second
+        self.random = random.Random(seed)
+
+    def settings(self):
+        return {"engine": self.name}
+
+    def recognize_batch(self, audio_list):
+        return [self.recognize(audio_data) for audio_data in audio_list]
+
+    def recognize(self, audio_data):
+        seconds = len(audio_data.frame_data) / (
+            audio_data.sample_rate * audio_data.sample_width
+        )
+        time.sleep(self.latency + self.random.uniform(0, self.jitter))
+        repeats = max(1, int(seconds * self.chars_per_second / len(MOCK_SENTENCE)))
+        return (MOCK_SENTENCE * repeats).strip()
+
+
+class MockResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class MockGeminiModel:
+    """แทน genai.GenerativeModel: หน่วงเวลาต่อครั้ง ตอบ JSON เมื่อ prompt ขอ JSON"""
+
+    def __init__(self, latency, stream_parts=10):
+        self.latency = latency
+        self.stream_parts = stream_parts
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        if "JSON" in prompt:
+            text = json.dumps(MOCK_RESULT, ensure_ascii=False)
+        else:
+            text = MOCK_RESULT["post"]
+
+        if not stream:
+            time.sleep(self.latency)
+            return MockResponse(text)
+        return self._stream(text)
+
+    def _stream(self, text):
+        step = max(1, len(text) // self.stream_parts)
+        for i in range(0, len(text), step):
+            time.sleep(self.latency / self.stream_parts)
+            yield MockResponse(text[i : i + step])
+
+
+def run_case(file_path, settings, asr_latency, asr_jitter, llm_latency):
+    """รัน 1 กรณี (ใน process ใหม่) คืน metrics records ของทั้งสองช่วง"""
+    processor = DhammaPostCreator("bench", **settings)
+    processor.asr = MockRecognizer(asr_latency, asr_jitter)
+    processor.gemini_model = MockGeminiModel(llm_latency)
+
+    started = time.perf_counter()
+    initial_result = processor.process_file(file_path)
+    final_result = processor.continue_processing(
+        initial_result["transcript"], "ธรรมะ", on_post_token=lambda text: None
+    )
+
+    return {
+        "duration": initial_result["duration"],
+        "transcript_chars": len(initial_result["transcript"]),
+        "wall_seconds": time.perf_counter() - started,
+        "metrics": initial_result["metrics"] + final_result["metrics"],
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+
+
+def summarize_case(name, result):
+    """แปลงผลของ 1 กรณีเป็นแถวรายงาน (ต่อขั้นตอน)"""
+    rows = []
+    for row in PipelineMetrics(result["metrics"]).summary():
+        wall = max(row["wall_seconds"], 1e-9)
+        rows.append(
+            {
+                "case": name,
+                "stage": row["stage"],
+                "count": row["count"],
+                "wall_seconds": row["wall_seconds"],
+                "cpu_seconds": row["cpu_seconds"],
+                "mb_per_second": row["bytes"] / 1024 / 1024 / wall,
+                "rss_mb": row["rss_bytes"] / 1024 / 1024,
+            }
+        )
+    return rows
+
+
+def format_report(cases):
+    lines = [
+        f"{'case':<12} {'stage':<14} {'n':>5} {'wall s':>9} {'cpu s':>9} "
+        f"{'MB/s':>9} {'RSS MB':>8}"
+    ]
+    for name, result in cases.items():
+        realtime = (result["duration"] or 0) / max(result["wall_seconds"], 1e-9)
+        peak_mb = (result.get("peak_rss_bytes") or 0) / 1024 / 1024
+        lines.append(
+            f"{name:<12} {'(total)':<14} {'':>5} {result['wall_seconds']:>9.2f} "
+            f"{'':>9} {'':>9} {peak_mb:>8.0f}  {realtime:.1f}x realtime, "
+            f"{result['transcript_chars']} ตัวอักษร"
+        )
+        for row in summarize_case(name, result):
+            lines.append(
+                f"{'':<12} {row['stage']:<14} {row['count']:>5} "
+                f"{row['wall_seconds']:>9.2f} {row['cpu_seconds']:>9.2f} "
+                f"{row['mb_per_second']:>9.2f} {row['rss_mb']:>8.0f}"
+            )
+    return "\n".join(lines)
+
+
+def find_regressions(cases, baseline, tolerance):
+    """คืน list ข้อความของขั้นตอนที่ช้ากว่า baseline เกิน tolerance"""
+    regressions = []
+    for name, result in cases.items():
+        if name not in baseline:
+            continue
+        current = {row["stage"]: row for row in summarize_case(name, result)}
+        previous = {row["stage"]: row for row in summarize_case(name, baseline[name])}
+        for stage in GUARDED_STAGES:
+            if stage not in current or stage not in previous:
+                continue
+            now = current[stage]["wall_seconds"]
+            before = previous[stage]["wall_seconds"]
+            if now > before * (1 + tolerance):
+                regressions.append(
+                    f"{name}/{stage}: {before:.2f}s -> {now:.2f}s "
+                    f"(+{(now / max(before, 1e-9) - 1) * 100:.0f}%)"
+                )
+    return regressions
+
+
+def measure_imports(modules=APP_MODULES):
+    """import โมดูลใน interpreter ใหม่ด้วย -X importtime
+
+    คืน (แถว (ชื่อ, self us, cumulative us, ระดับ), โมดูลหนักที่ถูกโหลด)
+    """
+    code = (
+        f"import sys, json\nimport {', '.join(modules)}\n"
+        f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    )
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        # import ซ้อนถูกเยื้องเข้าไประดับละ 2 ช่อง
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows, json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def report_imports(budget_ms, modules=APP_MODULES):
+    """พิมพ์รายงานเวลา import คืน True ถ้าอยู่ในงบและไม่มีไลบรารีหนักถูกโหลด"""
+    rows, heavy_loaded = measure_imports(modules)
+    total_ms = (
+        sum(
+            cumulative
+            for name, _, cumulative, depth in rows
+            if depth == 0 and name in modules
+        )
+        / 1000
+    )
+
+    print(f"{'module':<40} {'self ms':>9} {'cumul ms':>9}")
+    for name, self_us, cumulative_us, _ in sorted(rows, key=lambda r: -r[1])[:15]:
+        print(f"{name:<40} {self_us / 1000:>9.1f} {cumulative_us / 1000:>9.1f}")
+    print(
+        f"\nรวมเวลา import ของ {', '.join(modules)}: {total_ms:.1f} ms "
+        f"(งบ {budget_ms:.0f} ms)"
+    )
+
+    ok = total_ms <= budget_ms
+    if heavy_loaded:
+        print(f"ไลบรารีหนักถูกโหลดตั้งแต่เริ่ม: {', '.join(heavy_loaded)}")
+        ok = False
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="วัดประสิทธิภาพ pipeline ด้วยไฟล์สังเคราะห์และ API จำลอง"
+    )
+    parser.add_argument(
+        "--minutes", type=int, nargs="+", default=[1, 10, 60], help="ความยาวไฟล์ทดสอบ"
+    )
+    parser.add_argument(
+        "--kinds", nargs="+", choices=["audio", "video"], default=["audio", "video"]
+    )
+    parser.add_argument("--fixture-dir", default=FIXTURE_DIR)
+    parser.add_argument("--workers", type=int, default=4, help="max_workers")
+    parser.add_argument(
+        "--rps",
+        type=float,
+        default=1000.0,
+        help="requests/วินาที ของ rate limiter (ค่าสูง = วัดเฉพาะตัว pipeline)",
+    )
+    parser.add_argument("--asr-latency", type=float, default=0.05, help="วินาที/ส่วน")
+    parser.add_argument("--asr-jitter", type=float, default=0.02)
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="วินาที/ครั้ง")
+    parser.add_argument("--save", help="บันทึกผลเป็น JSON เพื่อใช้เป็น baseline")
+    parser.add_argument("--baseline", help="ไฟล์ JSON จาก --save ครั้งก่อน")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument(
+        "--imports", action="store_true", help="วัดเวลา import ตอนเริ่มแอปแทน"
+    )
+    parser.add_argument("--import-budget-ms", type=float, default=150.0)
+    parser.add_argument(
+        "--library",
+        type=int,
+        metavar="N",
+        help="วัดเวลาค้นหาในคลังธรรมะสังเคราะห์ N ไฟล์แทน",
+    )
+    parser.add_argument("--search-budget-ms", type=float, default=100.0)
+    args = parser.parse_args(argv)
+
+    if args.imports:
+        return 0 if report_imports(args.import_budget_ms) else 1
+    if args.library:
+        ok = report_library(args.library, args.search_budget_ms, args.fixture_dir)
+        return 0 if ok else 1
+
+    settings = {"max_workers": args.workers, "requests_per_second": args.rps}
+    cases = {}
+    for kind in args.kinds:
+        for minutes in args.minutes:
+            name = f"{kind}-{minutes}m"
+            file_path = make_fixture(kind, minutes, args.fixture_dir)
+            print(f"กำลังวัด {name} ...", file=sys.stderr)
+
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                cases[name] = executor.submit(
+                    run_case,
+                    file_path,
+                    settings,
+                    args.asr_latency,
+                    args.asr_jitter,
+                    args.llm_latency,
+                ).result()
+
+    print(format_report(cases))
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(cases, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = find_regressions(cases, baseline, args.tolerance)
+        for message in regressions:
+            print(f"ช้าลง: {message}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1 @@
+# ให้ pytest import โมดูลของโปรเจกต์จาก root ได้ (เช่น import stitch)
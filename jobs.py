@@ -0,0 +1,388 @@
+"""
+jobs.py - คิวงานเบื้องหลัง (SQLite) + process pool สำหรับรันขั้นตอนของ DhammaPostCreator
+งานทำต่อได้แม้ Streamlit rerun หรือรีเฟรชเบราว์เซอร์ UI แค่เก็บ job id แล้วคอยถามสถานะ
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import threading
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from processor import (
+    CACHE_DIR,
+    DhammaPostCreator,
+    configure_logging,
+    open_checkpoint_store,
+    open_llm_cache,
+    open_transcript_cache,
+)
+
+JOBS_DB_PATH = os.path.join(CACHE_DIR, "jobs.sqlite3")
+
+# สถานะที่ยังไม่จบ
+ACTIVE_STATUSES = ("queued", "running")
+
+# worker ที่กำลังรันงานบันทึก heartbeat ทุก HEARTBEAT_SECONDS
+# งาน running ที่ไม่มี heartbeat นานเกิน STALE_SECONDS ถือว่า worker ตายไปแล้ว
+HEARTBEAT_SECONDS = 10
+STALE_SECONDS = 120
+
+# โพสต์ที่กำลัง stream ถูกเขียนลง SQLite ไม่เกินทุก PARTIAL_OUTPUT_SECONDS
+# (UI ถามสถานะทุก 0.25 วินาทีระหว่าง stream จึงเห็นข้อความใหม่ภายในไม่ถึงครึ่งวินาที)
+PARTIAL_OUTPUT_SECONDS = 0.1
+
+
+@contextlib.contextmanager
+def connect(db_path):
+    db = sqlite3.connect(db_path, timeout=30)
+    db.row_factory = sqlite3.Row
+    try:
+        with db:
+            yield db
+    finally:
+        db.close()
+
+
+def init_db(db_path):
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    with connect(db_path) as db:
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                progress TEXT,
+                partial_output TEXT,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                heartbeat_at REAL,
+                finished_at REAL,
+                owner TEXT
+            )
+            """
+        )
+        # ฐานข้อมูลจากรุ่นก่อนยังไม่มีคอลัมน์ heartbeat_at / owner
+        columns = {row["name"] for row in db.execute("PRAGMA table_info(jobs)")}
+        if "heartbeat_at" not in columns:
+            db.execute("ALTER TABLE jobs ADD COLUMN heartbeat_at REAL")
+        if "owner" not in columns:
+            db.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+
+
+def update_job(db_path, job_id, **fields):
+    columns = ", ".join(f"{name} = ?" for name in fields)
+    with connect(db_path) as db:
+        db.execute(
+            f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id)
+        )
+
+
+def expire_stale_jobs(db, job_id=None):
+    """ปิดงาน running ที่ไม่มี heartbeat นานเกิน STALE_SECONDS (worker ตายไปแล้ว)"""
+    now = time.time()
+    params = ["worker ไม่ตอบสนอง งานถูกยกเลิก กรุณาลองใหม่", now, now - STALE_SECONDS]
+    where = ""
+    if job_id is not None:
+        where = " AND id = ?"
+        params.append(job_id)
+    db.execute(
+        "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? "
+        "WHERE status = 'running' AND COALESCE(heartbeat_at, started_at) < ?"
+        + where,
+        params,
+    )
+
+
+def owner_is_alive(owner):
+    """owner คือ "host:pid:uuid" ของ JobQueue ที่รับงาน
+
+    ตรวจได้เฉพาะ process บนเครื่องเดียวกัน (และไม่ใช่ Windows ที่ os.kill
+    ส่งสัญญาณ 0 ไม่ได้) กรณีอื่นถือว่ายังอยู่ งานจะถูกปิดเมื่อ heartbeat หยุดแทน
+    """
+    try:
+        host, pid, _ = owner.split(":")
+        pid = int(pid)
+    except (AttributeError, ValueError):
+        return False  # งานจากรุ่นก่อนที่ไม่มี owner
+    if host != socket.gethostname() or os.name == "nt":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def fail_active_job(db_path, job_id, error):
+    """ปิดงานเป็น failed ถ้ายังไม่จบ (ไม่ทับผลของงานที่เสร็จไปแล้ว)"""
+    with connect(db_path) as db:
+        db.execute(
+            "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? "
+            "WHERE id = ? AND status IN (?, ?)",
+            (error, time.time(), job_id, *ACTIVE_STATUSES),
+        )
+
+
+# processor ที่สร้างแล้วใน worker process นี้ (key: API key + การตั้งค่า)
+# worker รันทีละงาน จึงใช้ instance เดิมซ้ำได้โดยไม่ชนกัน
+# เก็บไม่เกิน MAX_PROCESSORS ชุด (ทิ้งชุดที่ใช้นานที่สุดก่อน) และล้างทั้งหมด
+# เมื่อ generation ของงานเปลี่ยน (JobQueue.reset_processors)
+MAX_PROCESSORS = 4
+_processors = {}
+_generation = [0]
+
+
+def get_processor(api_key, settings, generation=0):
+    if generation != _generation[0]:
+        _processors.clear()
+        _generation[0] = generation
+
+    key = (api_key, json.dumps(settings, sort_keys=True))
+    if key in _processors:
+        _processors[key] = _processors.pop(key)
+    else:
+        while len(_processors) >= MAX_PROCESSORS:
+            del _processors[next(iter(_processors))]
+        _processors[key] = DhammaPostCreator(
+            api_key,
+            transcript_cache=open_transcript_cache(),
+            llm_cache=open_llm_cache(),
+            checkpoint_store=open_checkpoint_store(),
+            **settings,
+        )
+    return _processors[key]
+
+
+def run_job(db_path, job_id, api_key, settings, generation=0):
+    """รันงาน 1 งานใน worker process (ต้องเป็นฟังก์ชันระดับ module เพื่อ pickle ได้)"""
+    with connect(db_path) as db:
+        now = time.time()
+        claimed = db.execute(
+            "UPDATE jobs SET status = 'running', started_at = ?, heartbeat_at = ? "
+            "WHERE id = ? AND status = 'queued'",
+            (now, now, job_id),
+        ).rowcount
+        row = db.execute("SELECT kind, payload FROM jobs WHERE id = ?", (job_id,))
+        row = row.fetchone()
+
+    if not claimed or row is None:
+        return
+
+    payload = json.loads(row["payload"])
+    warnings = []
+    last_partial = [0.0]
+
+    def progress_callback(message):
+        update_job(db_path, job_id, progress=message)
+
+    def on_post_token(text):
+        now = time.monotonic()
+        if now - last_partial[0] >= PARTIAL_OUTPUT_SECONDS:
+            last_partial[0] = now
+            update_job(db_path, job_id, partial_output=text)
+
+    stop_heartbeat = threading.Event()
+
+    def heartbeat():
+        # หยุดเองเมื่อ process ตาย UI จึงรู้ได้ว่างานค้างจาก heartbeat ที่เก่าเกินไป
+        while not stop_heartbeat.wait(HEARTBEAT_SECONDS):
+            update_job(db_path, job_id, heartbeat_at=time.time())
+
+    threading.Thread(target=heartbeat, daemon=True).start()
+
+    try:
+        processor = get_processor(api_key, settings, generation)
+
+        if row["kind"] == "transcribe":
+            result = processor.process_file(
+                payload["file_path"],
+                category=payload["category"],
+                progress_callback=progress_callback,
+                file_hash=payload.get("file_hash"),
+                warning_callback=warnings.append,
+            )
+        elif row["kind"] == "generate":
+            result = processor.continue_processing(
+                payload["transcript"],
+                payload["category"],
+                progress_callback=progress_callback,
+                on_post_token=on_post_token,
+            )
+        else:
+            raise Exception(f"ไม่รู้จักประเภทงาน: {row['kind']}")
+
+        result["warnings"] = warnings
+        update_job(
+            db_path,
+            job_id,
+            status="done",
+            result=json.dumps(result, ensure_ascii=False),
+            finished_at=time.time(),
+        )
+    except Exception as e:
+        update_job(
+            db_path, job_id, status="failed", error=str(e), finished_at=time.time()
+        )
+    finally:
+        stop_heartbeat.set()
+
+
+# JobQueue ล่าสุดของแต่ละฐานข้อมูลใน process นี้ (ล้าง st.cache_resource แล้ว
+# สร้างใหม่ได้) ตัวเก่าถูกปลดเมื่อมีตัวใหม่ แต่งานที่รับไว้แล้วยังทำต่อจนเสร็จ
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+class JobQueue:
+    """คิวงานที่เก็บสถานะใน SQLite และส่งงานให้ process pool ของ server
+
+    หลาย instance (หรือหลาย server process) ใช้ฐานข้อมูลเดียวกันได้
+    แต่ละงานบันทึก owner ไว้ instance ใหม่จึงปิดเฉพาะงานที่ไม่มีใครทำต่อแล้ว
+    """
+
+    def __init__(self, db_path=JOBS_DB_PATH, max_workers=2):
+        self.db_path = db_path
+        self.max_workers = max_workers
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}"
+        init_db(db_path)
+
+        self._executor_lock = threading.Lock()
+        self._executor = self._new_executor()
+        self._retired = False
+        # เพิ่มทุกครั้งที่ reset_processors() ส่งไปกับทุกงาน
+        self.generation = 0
+
+        with _queues_lock:
+            previous = _queues.get(db_path)
+            _queues[db_path] = self
+        if previous is not None:
+            previous.retire()
+
+        # งานที่เจ้าของหายไปแล้ว (server รอบก่อน) ไม่มี API key จึงปิดเป็น failed
+        with connect(db_path) as db:
+            expire_stale_jobs(db)
+            orphans = [
+                row["id"]
+                for row in db.execute(
+                    "SELECT id, owner FROM jobs WHERE status = 'queued'"
+                )
+                if not owner_is_alive(row["owner"])
+            ]
+            db.executemany(
+                "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? "
+                "WHERE id = ? AND status = 'queued'",
+                [
+                    ("งานถูกยกเลิกเพราะ server รีสตาร์ท", time.time(), job_id)
+                    for job_id in orphans
+                ],
+            )
+
+    def _new_executor(self):
+        # spawn: worker ไม่ต้อง fork thread ของ Streamlit มาด้วย
+        # (จึงต้องตั้งค่า logging ใหม่ในแต่ละ worker)
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=configure_logging,
+        )
+
+    def _replace_broken_executor(self, broken):
+        """worker ตายกะทันหัน (เช่น หน่วยความจำไม่พอ) ทำให้ pool ใช้ต่อไม่ได้อีกเลย
+        จึงสร้าง pool ใหม่แทน (ครั้งเดียว แม้หลายงานจะล้มพร้อมกัน)
+        """
+        with self._executor_lock:
+            if self._executor is broken and not self._retired:
+                broken.shutdown(wait=False, cancel_futures=True)
+                self._executor = self._new_executor()
+            return self._executor
+
+    def _on_job_done(self, job_id, executor, future):
+        # run_job บันทึกผลเองเสมอ future ล้มเมื่อ worker ตายหรือ pool เสียเท่านั้น
+        if future.cancelled():
+            fail_active_job(self.db_path, job_id, "งานถูกยกเลิก")
+            return
+        error = future.exception()
+        if error is None:
+            return
+        if isinstance(error, BrokenProcessPool):
+            self._replace_broken_executor(executor)
+            error = "worker หยุดทำงานกะทันหัน (เช่น หน่วยความจำไม่พอ) กรุณาลองใหม่"
+        fail_active_job(self.db_path, job_id, str(error))
+
+    def submit(self, kind, payload, api_key, settings=None):
+        """เพิ่มงานเข้าคิว คืน job id (API key ส่งให้ worker โดยตรง ไม่เก็บลงดิสก์)"""
+        if self._retired:
+            # ถูกแทนที่แล้ว (ยังมีผู้ถือ reference เก่าอยู่) ส่งต่อให้ตัวล่าสุด
+            return _queues[self.db_path].submit(kind, payload, api_key, settings)
+
+        job_id = uuid.uuid4().hex
+        with connect(self.db_path) as db:
+            db.execute(
+                "INSERT INTO jobs (id, kind, status, payload, created_at, owner) "
+                "VALUES (?, ?, 'queued', ?, ?, ?)",
+                (
+                    job_id,
+                    kind,
+                    json.dumps(payload, ensure_ascii=False),
+                    time.time(),
+                    self.owner,
+                ),
+            )
+
+        settings = settings or {}
+        args = (run_job, self.db_path, job_id, api_key, settings, self.generation)
+        executor = self._executor
+        try:
+            future = executor.submit(*args)
+        except BrokenProcessPool:
+            executor = self._replace_broken_executor(executor)
+            future = executor.submit(*args)
+        future.add_done_callback(
+            lambda future: self._on_job_done(job_id, executor, future)
+        )
+        return job_id
+
+    def reset_processors(self):
+        """ให้ worker ทุกตัวทิ้ง processor ที่สร้างไว้ (เช่น หลังเปลี่ยน API key)
+
+        worker ตรวจ generation ตอนรับงานถัดไป จึงไม่ต้องสร้าง pool ใหม่
+        """
+        self.generation += 1
+
+    def get(self, job_id):
+        """สถานะงาน งาน running ที่ไม่มี heartbeat นานเกินไปถูกปิดเป็น failed"""
+        with connect(self.db_path) as db:
+            expire_stale_jobs(db, job_id)
+            row = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+        if row is None:
+            return None
+
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def retire(self):
+        """หยุดรับงานใหม่ งานที่อยู่ใน pool แล้วทำต่อจนเสร็จ จากนั้น worker จึงจบ"""
+        with self._executor_lock:
+            self._retired = True
+            self._executor.shutdown(wait=False)
+
+    def shutdown(self):
+        with self._executor_lock:
+            self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,43 @@
+"""
+lazy.py - import ไลบรารีหนักเมื่อใช้ครั้งแรก
+
+หน้าแรกของแอป (ยังไม่ใส่ API Key) ไม่ต้องใช้ speech_recognition, pydub,
+google.generativeai หรือ ffmpeg จึงไม่ควรเสียเวลา import ตั้งแต่เริ่ม
+
+ไม่ใช้ importlib.util.LazyLoader เพราะต้องใส่โมดูลไว้ใน sys.modules
+และตัวเฝ้าไฟล์ของ Streamlit อ่าน __file__ ของทุกโมดูลซึ่งจะทำให้ import ทันที
+"""
+
+import importlib
+
+# โมดูลที่ต้องไม่ถูก import ระหว่างแสดงหน้าแรก (ตรวจโดย bench.py --imports)
+HEAVY_MODULES = (
+    "speech_recognition",
+    "pydub",
+    "google.generativeai",
+    "google.api_core",
+    "ffmpeg",
+    "numpy",
+    "faster_whisper",
+)
+
+
+class LazyModule:
+    """ตัวแทนโมดูลที่ import จริงเมื่อถูกเรียก attribute ครั้งแรก"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            # importlib มี lock ของตัวเอง หลาย thread เรียกพร้อมกันได้
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
@@ -0,0 +1,301 @@
+"""
+library.py - คลังธรรมะที่ประมวลผลแล้ว ค้นหาแบบข้อความเต็มได้ (SQLite FTS5)
+
+เก็บ transcript, โพสต์, แก่นธรรม, คำสำคัญ และคำคมของทุกไฟล์ที่ประมวลผลเสร็จ
+ผู้ดูแลเพจจึงค้นหาและนำเนื้อหาเดิมมาใช้ได้ โดยไม่ต้องถอดเสียงใหม่
+
+ใช้ tokenizer แบบ trigram เพราะภาษาไทยไม่เว้นวรรคระหว่างคำ ทุก substring
+ยาว 3 ตัวอักษรขึ้นไปจึงค้นผ่าน index ได้โดยไม่ต้องตัดคำ (ต้องใช้ SQLite 3.34+)
+คำค้นที่สั้นกว่า 3 ตัวอักษรใช้ LIKE แทน (ช้ากว่าแต่ยังถูกต้อง)
+"""
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import contextlib
+
+DATA_DIR = os.environ.get(
+    "DHAMMA_DATA_DIR",
+    os.path.join(os.path.expanduser("~"), ".local", "share", "dhamma"),
+)
+
+# คอลัมน์สั้นที่จัดอันดับด้วย bm25 และน้ำหนัก (พบในหัวข้อ/แก่นธรรม สำคัญกว่าพบในคำคม)
+RANKED_COLUMNS = {
+    "headline": 5.0,
+    "main_teaching": 4.0,
+    "keywords": 4.0,
+    "essences": 2.0,
+    "quote": 1.0,
+}
+# คอลัมน์ยาวที่ค้นได้แต่ไม่จัดอันดับ
+BODY_COLUMNS = ("post", "transcript")
+SEARCH_COLUMNS = tuple(RANKED_COLUMNS) + BODY_COLUMNS
+
+TRIGRAM = 3
+
+
+def talk_key(transcript):
+    """ไฟล์เดิมที่ประมวลผลซ้ำได้ transcript เดิม จึงแทนที่รายการเดิมในคลัง"""
+    return hashlib.sha1(transcript.encode("utf-8")).hexdigest()
+
+
+def _excerpt(text, term, width=60):
+    """ข้อความรอบคำค้นแรกที่พบ (ใช้เมื่อ snippet() ของ FTS5 ใช้ไม่ได้)"""
+    index = text.lower().find(term.lower())
+    if index < 0:
+        return text[:width] + ("…" if len(text) > width else "")
+    start = max(index - width // 2, 0)
+    end = min(index + len(term) + width // 2, len(text))
+    return (
+        ("…" if start else "")
+        + text[start:index]
+        + f"**{text[index : index + len(term)]}**"
+        + text[index + len(term) : end]
+        + ("…" if end < len(text) else "")
+    )
+
+
+class TalkLibrary:
+    """ตาราง talks เก็บเนื้อหา มี FTS5 index ภายนอก (external content) 2 ชุด
+    ที่ trigger อัปเดตให้อัตโนมัติ
+
+    - talks_fts: หัวข้อ แก่นธรรม คำสำคัญ คำคม (ข้อความสั้น จัดอันดับด้วย bm25)
+    - bodies_fts: โพสต์และ transcript (ข้อความยาว ไม่จัดอันดับ เรียงใหม่สุดก่อน)
+
+    แยกกันเพราะ bm25 ต้องอ่านทุกแถวที่ตรงคำค้น คำอย่าง "สติ" ตรงเกือบทุกไฟล์
+    ถ้าจัดอันดับรวมข้อความยาวด้วย เวลาค้นหาจะโตตามขนาดคลังทั้งหมด
+    """
+
+    INDEXES = {
+        "talks_fts": tuple(RANKED_COLUMNS),
+        "bodies_fts": BODY_COLUMNS,
+    }
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._db() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS talks (id INTEGER PRIMARY KEY, "
+                "talk_key TEXT UNIQUE, file_name TEXT, category TEXT, "
+                "created_at REAL, duration REAL, was_video INTEGER, emotion TEXT, "
+                f"{' TEXT, '.join(SEARCH_COLUMNS)} TEXT)"
+            )
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS talks_category "
+                "ON talks (category, created_at)"
+            )
+            for index, columns in self.INDEXES.items():
+                self._create_index(db, index, columns)
+
+    @staticmethod
+    def _create_index(db, index, columns):
+        names = ", ".join(columns)
+        new_values = ", ".join(f"new.{column}" for column in columns)
+        old_values = ", ".join(f"old.{column}" for column in columns)
+        try:
+            db.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {index} USING fts5("
+                f"{names}, content='talks', content_rowid='id', tokenize='trigram')"
+            )
+        except sqlite3.OperationalError as e:
+            raise Exception(
+                f"SQLite {sqlite3.sqlite_version} ไม่รองรับ FTS5 trigram "
+                f"(ต้องการ 3.34 ขึ้นไป): {e}"
+            )
+        db.executescript(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {index}_ai AFTER INSERT ON talks BEGIN
+                INSERT INTO {index} (rowid, {names}) VALUES (new.id, {new_values});
+            END;
+            CREATE TRIGGER IF NOT EXISTS {index}_ad AFTER DELETE ON talks BEGIN
+                INSERT INTO {index} ({index}, rowid, {names})
+                VALUES ('delete', old.id, {old_values});
+            END;
+            CREATE TRIGGER IF NOT EXISTS {index}_au AFTER UPDATE ON talks BEGIN
+                INSERT INTO {index} ({index}, rowid, {names})
+                VALUES ('delete', old.id, {old_values});
+                INSERT INTO {index} (rowid, {names}) VALUES (new.id, {new_values});
+            END;
+            """
+        )
+
+    @contextlib.contextmanager
+    def _db(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        db.row_factory = sqlite3.Row
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def add(self, record, file_name=None, category=None):
+        """บันทึกผลลัพธ์ 1 ไฟล์ (dict แบบ final_result) คืน id ในคลัง"""
+        values = {
+            "talk_key": talk_key(record["transcript"]),
+            "file_name": file_name,
+            "category": category,
+            "created_at": time.time(),
+            "duration": record.get("duration"),
+            "was_video": int(bool(record.get("was_video"))),
+            "emotion": record.get("emotion"),
+            "headline": record.get("headline"),
+            "main_teaching": record.get("main_teaching"),
+            "keywords": ", ".join(record.get("keywords") or []),
+            # JSON list เก็บแก่นธรรมที่ว่างหรือมีขึ้นบรรทัดใหม่ไว้ครบตามตำแหน่ง
+            "essences": json.dumps(
+                [record.get(f"essence_{i}") or "" for i in (1, 2, 3)],
+                ensure_ascii=False,
+            ),
+            "quote": record.get("quote"),
+            "post": record.get("post"),
+            "transcript": record["transcript"],
+        }
+        names = ", ".join(values)
+        updates = ", ".join(f"{name} = excluded.{name}" for name in values)
+        with self._db() as db:
+            # ON CONFLICT ... DO UPDATE (ไม่ใช่ INSERT OR REPLACE) เพื่อให้ trigger
+            # ลบข้อความเดิมออกจาก index ก่อนใส่ข้อความใหม่
+            db.execute(
+                f"INSERT INTO talks ({names}) VALUES "
+                f"({', '.join('?' * len(values))}) "
+                f"ON CONFLICT (talk_key) DO UPDATE SET {updates}",
+                list(values.values()),
+            )
+            row = db.execute(
+                "SELECT id FROM talks WHERE talk_key = ?", (values["talk_key"],)
+            ).fetchone()
+        return row["id"]
+
+    def search(self, query, category=None, limit=20):
+        """ค้นหาด้วยคำค้นคั่นด้วยช่องว่าง (ต้องพบทุกคำ)
+
+        ไฟล์ที่พบในหัวข้อ/แก่นธรรม/คำสำคัญ/คำคมมาก่อน เรียงตามความเกี่ยวข้อง
+        ตามด้วยไฟล์ที่พบเฉพาะในโพสต์หรือ transcript เรียงจากใหม่ไปเก่า
+        คืน list ของ dict: id, file_name, category, created_at, headline,
+        main_teaching, snippet (คำที่พบถูกครอบด้วย ** สำหรับ markdown)
+        """
+        terms = query.split()
+        if not terms:
+            return []
+        long_terms = [term for term in terms if len(term) >= TRIGRAM]
+        short_terms = [term for term in terms if len(term) < TRIGRAM]
+
+        # คำสั้นกว่า trigram ค้นผ่าน index ไม่ได้ ใช้ LIKE กรองแถวแทน
+        filters = []
+        params = []
+        like = " OR ".join(f"t.{c} LIKE ? ESCAPE '\\'" for c in SEARCH_COLUMNS)
+        for term in short_terms:
+            escaped = (
+                term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            )
+            filters.append(f"({like})")
+            params.extend([f"%{escaped}%"] * len(SEARCH_COLUMNS))
+        if category:
+            filters.append("t.category = ?")
+            params.append(category)
+
+        with self._db() as db:
+            if not long_terms:
+                rows = db.execute(
+                    "SELECT t.*, NULL AS snippet FROM talks t "
+                    f"WHERE {' AND '.join(filters)} ORDER BY t.id DESC LIMIT ?",
+                    params + [limit],
+                ).fetchall()
+                return [self._result(row, terms[0]) for row in rows]
+
+            # ครอบทุกคำเป็น phrase ตัวอักษรพิเศษของ FTS5 ในคำค้นจึงไม่มีผล
+            match = " ".join('"' + term.replace('"', '""') + '"' for term in long_terms)
+            where = " AND ".join(["talks_fts MATCH ?"] + filters)
+            weights = ", ".join(str(weight) for weight in RANKED_COLUMNS.values())
+            rows = db.execute(
+                "SELECT t.*, snippet(talks_fts, -1, '**', '**', '…', 24) AS snippet "
+                "FROM talks_fts JOIN talks t ON t.id = talks_fts.rowid "
+                f"WHERE {where} ORDER BY bm25(talks_fts, {weights}) LIMIT ?",
+                [match] + params + [limit],
+            ).fetchall()
+
+            if len(rows) < limit:
+                found = [row["id"] for row in rows]
+                where = " AND ".join(
+                    ["bodies_fts MATCH ?"]
+                    + filters
+                    + [f"t.id NOT IN ({', '.join('?' * len(found))})"]
+                )
+                rows += db.execute(
+                    "SELECT t.*, snippet(bodies_fts, -1, '**', '**', '…', 24) "
+                    "AS snippet FROM bodies_fts "
+                    "JOIN talks t ON t.id = bodies_fts.rowid "
+                    f"WHERE {where} ORDER BY bodies_fts.rowid DESC LIMIT ?",
+                    [match] + params + found + [limit - len(rows)],
+                ).fetchall()
+
+        return [self._result(row, terms[0]) for row in rows]
+
+    @staticmethod
+    def _result(row, term):
+        snippet = row["snippet"]
+        if snippet is None:
+            text = next(
+                (
+                    row[column]
+                    for column in SEARCH_COLUMNS
+                    if row[column] and term.lower() in row[column].lower()
+                ),
+                "",
+            )
+            snippet = _excerpt(text, term)
+        return {
+            "id": row["id"],
+            "file_name": row["file_name"],
+            "category": row["category"],
+            "created_at": row["created_at"],
+            "headline": row["headline"],
+            "main_teaching": row["main_teaching"],
+            "snippet": snippet,
+        }
+
+    def get(self, talk_id):
+        """คืนรายการเต็ม (dict แบบ final_result + file_name, category) หรือ None"""
+        with self._db() as db:
+            row = db.execute("SELECT * FROM talks WHERE id = ?", (talk_id,)).fetchone()
+        if row is None:
+            return None
+        record = dict(row)
+        record["keywords"] = [k for k in record["keywords"].split(", ") if k]
+        essences = self._essences(record.pop("essences"))
+        for i in (1, 2, 3):
+            record[f"essence_{i}"] = essences[i - 1] if i <= len(essences) else ""
+        record["was_video"] = bool(record["was_video"])
+        return record
+
+    @staticmethod
+    def _essences(stored):
+        if not stored:
+            return []
+        try:
+            essences = json.loads(stored)
+        except ValueError:
+            essences = None
+        if isinstance(essences, list):
+            return essences
+        # รายการจากรุ่นก่อน: คั่นด้วยขึ้นบรรทัดใหม่
+        return stored.split("\n")
+
+    def delete(self, talk_id):
+        with self._db() as db:
+            db.execute("DELETE FROM talks WHERE id = ?", (talk_id,))
+
+    def count(self):
+        with self._db() as db:
+            return db.execute("SELECT COUNT(*) FROM talks").fetchone()[0]
+
+
+def open_talk_library():
+    """คลังธรรมะ (ทุก process เปิดไฟล์เดียวกัน) อยู่ใน DATA_DIR ไม่ใช่แคช
+    จึงไม่หายเมื่อล้างแคช
+    """
+    return TalkLibrary(os.path.join(DATA_DIR, "library.sqlite3"))
@@ -0,0 +1,169 @@
+"""
+metrics.py - วัดเวลาและทรัพยากรของแต่ละขั้นตอนใน pipeline
+(probe, แยกเสียง, แปลงไฟล์, ถอดเสียงแต่ละส่วน, เรียก Gemini แต่ละครั้ง)
+ส่งออกเป็น JSON lines หรือ Prometheus text format ได้
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+import contextlib
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def current_rss_bytes():
+    """หน่วยความจำ (RSS) ของ process ขณะนี้ จาก /proc/self/statm
+
+    ใช้วัดต่อขั้นตอน เพราะ worker ถูกใช้ซ้ำหลายงาน ค่าสูงสุดตลอดอายุ process
+    จึงไม่บอกอะไรเกี่ยวกับขั้นตอนนั้น คืน None ถ้าไม่มี /proc (เช่น macOS, Windows)
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def peak_rss_bytes():
+    """หน่วยความจำสูงสุดของ process (RSS) ตลอดอายุ process ถ้าวัดไม่ได้คืน None
+
+    ไม่ใช่ค่าของขั้นตอนใดขั้นตอนหนึ่ง ใช้กับ process ที่รันงานเดียวแล้วจบ (bench)
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux รายงานเป็น KB, macOS เป็น bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class PipelineMetrics:
+    """เก็บ record ของแต่ละขั้นตอน ใช้ร่วมกันได้หลาย thread
+
+    enabled=False ยังวัดและ yield record ได้ตามปกติ แต่ไม่เก็บลง records
+    (instance ที่ไม่มีใครเรียก reset() จะได้ไม่สะสม record ไปเรื่อยๆ)
+    """
+
+    def __init__(self, records=None, enabled=True):
+        self.records = list(records or [])
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def reset(self):
+        with self._lock:
+            self.records = []
+
+    @contextlib.contextmanager
+    def stage(self, name, bytes_processed=0, per_thread=False, **labels):
+        """วัด 1 ขั้นตอน record ที่ yield ออกไปแก้ bytes/retries ระหว่างทางได้
+
+        per_thread=True ใช้ CPU time ของ thread นี้ (งานใน thread pool)
+        ไม่เช่นนั้นใช้ CPU time ของทั้ง process
+        """
+        cpu_clock = time.thread_time if per_thread else time.process_time
+        record = {
+            "stage": name,
+            "labels": labels,
+            "bytes": bytes_processed,
+            "retries": 0,
+            "ok": True,
+        }
+        stack = self._stack()
+        stack.append(record)
+        record["rss_start_bytes"] = current_rss_bytes()
+        wall_start = time.perf_counter()
+        cpu_start = cpu_clock()
+
+        try:
+            yield record
+        except BaseException:
+            record["ok"] = False
+            raise
+        finally:
+            record["wall_seconds"] = time.perf_counter() - wall_start
+            record["cpu_seconds"] = cpu_clock() - cpu_start
+            record["rss_end_bytes"] = current_rss_bytes()
+            stack.remove(record)
+            if self.enabled:
+                with self._lock:
+                    self.records.append(record)
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def current(self):
+        """record ของขั้นตอนที่กำลังทำอยู่ใน thread นี้ (หรือ None)"""
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    def summary(self):
+        """รวมตามชื่อขั้นตอน: จำนวนครั้ง เวลา CPU bytes retries และหน่วยความจำ
+
+        rss_bytes = RSS สูงสุดที่วัดได้ตอนเริ่ม/จบขั้นตอน
+        rss_growth_bytes = RSS ที่เพิ่มขึ้นมากที่สุดระหว่างขั้นตอนเดียว
+        (ขั้นตอนที่ทำพร้อมกันหลาย thread นับหน่วยความจำของ thread อื่นด้วย)
+        """
+        rows = {}
+        for record in self.records:
+            row = rows.setdefault(
+                record["stage"],
+                {
+                    "stage": record["stage"],
+                    "count": 0,
+                    "wall_seconds": 0.0,
+                    "cpu_seconds": 0.0,
+                    "bytes": 0,
+                    "retries": 0,
+                    "errors": 0,
+                    "rss_bytes": 0,
+                    "rss_growth_bytes": 0,
+                },
+            )
+            row["count"] += 1
+            row["wall_seconds"] += record["wall_seconds"]
+            row["cpu_seconds"] += record["cpu_seconds"]
+            row["bytes"] += record["bytes"] or 0
+            row["retries"] += record["retries"]
+            row["errors"] += 0 if record["ok"] else 1
+            start = record.get("rss_start_bytes")
+            end = record.get("rss_end_bytes")
+            row["rss_bytes"] = max(row["rss_bytes"], start or 0, end or 0)
+            if start is not None and end is not None:
+                row["rss_growth_bytes"] = max(row["rss_growth_bytes"], end - start)
+        return list(rows.values())
+
+    def to_jsonl(self):
+        return "".join(
+            json.dumps(record, ensure_ascii=False) + "\n" for record in self.records
+        )
+
+    def to_prometheus(self, prefix="dhamma_stage"):
+        """Prometheus text exposition format (รวมตามขั้นตอน)"""
+        series = [
+            ("calls_total", "counter", "Number of times the stage ran", "count"),
+            ("wall_seconds_total", "counter", "Wall-clock time", "wall_seconds"),
+            ("cpu_seconds_total", "counter", "CPU time", "cpu_seconds"),
+            ("bytes_total", "counter", "Bytes processed", "bytes"),
+            ("retries_total", "counter", "Retries", "retries"),
+            ("errors_total", "counter", "Failed runs", "errors"),
+            ("rss_bytes", "gauge", "Process RSS at stage start/end", "rss_bytes"),
+            ("rss_growth_bytes", "gauge", "Largest RSS growth", "rss_growth_bytes"),
+        ]
+        summary = self.summary()
+        lines = []
+        for suffix, metric_type, help_text, field in series:
+            name = f"{prefix}_{suffix}"
+            lines.append(f"# HELP {name} {help_text} per pipeline stage.")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for row in summary:
+                lines.append(f'{name}{{stage="{row["stage"]}"}} {row[field]}')
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,165 @@
+"""
+preprocess.py - เตรียมเสียงด้วย NumPy ก่อนส่งถอดเสียง
+
+คำนวณพลังงานรายเฟรมของ PCM ทั้งไฟล์ (ทีละช่วง 60 วินาที) แล้วใช้ประเมิน noise floor
+(ครั้งเดียวต่อไฟล์) หาช่วงที่มีเสียงพูด (energy VAD) ปรับความดัง
+และวางแผนแบ่งส่วนตามช่วงเสียงพูด โดยไม่ต้องวนลูปทีละเฟรมใน Python
+"""
+
+from lazy import LazyModule
+
+np = LazyModule("numpy")
+
+FRAME_MS = 20
+
+# เสียงยาวกว่า 60 วินาทีที่พบเสียงพูดไม่ถึง 10% ถือว่า VAD ใช้ไม่ได้กับไฟล์นั้น
+VAD_FALLBACK_FRAMES = 60_000 // FRAME_MS
+MIN_SPEECH_RATIO = 0.1
+
+# แปลงเป็น float32 ทีละ 60 วินาที สำเนาชั่วคราวจึงไม่โตตามความยาวไฟล์
+ENERGY_BLOCK_FRAMES = 60_000 // FRAME_MS
+
+
+def frame_energy_db(
+    samples, sample_rate, frame_ms=FRAME_MS, block_frames=ENERGY_BLOCK_FRAMES
+):
+    """พลังงาน (dBFS) ของแต่ละเฟรม จาก int16 samples (เศษท้ายที่ไม่ครบเฟรมถูกตัด)"""
+    frame = sample_rate * frame_ms // 1000
+    count = len(samples) // frame
+    rms = np.empty(count, dtype=np.float32)
+    for start in range(0, count, block_frames):
+        end = min(start + block_frames, count)
+        block = samples[start * frame : end * frame].astype(np.float32)
+        block = block.reshape(end - start, frame)
+        rms[start:end] = np.sqrt(np.einsum("ij,ij->i", block, block) / frame)
+    return 20 * np.log10(np.maximum(rms, 1.0) / 32768.0)
+
+
+def estimate_noise_floor(energy_db, percentile=10):
+    """ระดับเสียงพื้นหลัง = เฟรมที่เบาที่สุดราว 10% ของไฟล์"""
+    return float(np.percentile(energy_db, percentile))
+
+
+def speech_regions(
+    energy_db,
+    floor_db,
+    threshold_db=8.0,
+    min_silence_frames=35,
+    min_speech_frames=10,
+    pad_frames=15,
+):
+    """คืน list ของ (เฟรมเริ่ม, เฟรมจบ) ของช่วงที่ดังกว่า noise floor
+
+    ช่วงเงียบสั้นกว่า min_silence_frames ถูกรวมเป็นช่วงเดียวกัน
+    ช่วงที่สั้นกว่า min_speech_frames ถูกทิ้ง (เสียงคลิก/เสียงกระแทก)
+    และเผื่อหัวท้ายช่วงละ pad_frames เพื่อไม่ให้ต้นคำถูกตัด
+    """
+    active = (energy_db > floor_db + threshold_db).astype(np.int8)
+    edges = np.diff(np.concatenate(([0], active, [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    if not len(starts):
+        return []
+
+    keep = starts[1:] - ends[:-1] >= min_silence_frames
+    starts = np.concatenate((starts[:1], starts[1:][keep]))
+    ends = np.concatenate((ends[:-1][keep], ends[-1:]))
+
+    long_enough = ends - starts >= min_speech_frames
+    starts = np.maximum(starts[long_enough] - pad_frames, 0)
+    ends = np.minimum(ends[long_enough] + pad_frames, len(energy_db))
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def speech_is_plausible(speech_frames, total_frames):
+    """False เมื่อเสียงยาวพอจะตัดสินได้ แต่พบเสียงพูดน้อยผิดปกติ
+
+    เช่น พูดต่อเนื่องบนดนตรี/เสียงพัดลม หรือหยุดพูดสั้นๆ แทบไม่มีช่วงเงียบ
+    เฟรมเบาสุด 10% จึงอยู่ระดับเดียวกับเสียงพูด และ speech_regions แทบไม่พบอะไร
+    """
+    if total_frames < VAD_FALLBACK_FRAMES:
+        return True
+    return speech_frames >= MIN_SPEECH_RATIO * total_frames
+
+
+def speech_gain(energy_db, regions, target_dbfs=-20.0, max_gain_db=20.0):
+    """ตัวคูณความดังที่ทำให้ช่วงเสียงพูดมีระดับเฉลี่ยเท่า target_dbfs"""
+    if not regions:
+        return 1.0
+    speech = np.concatenate([energy_db[start:end] for start, end in regions])
+    level_db = 10 * np.log10(np.mean(10 ** (speech / 10)))
+    gain_db = float(np.clip(target_dbfs - level_db, -max_gain_db, max_gain_db))
+    return 10 ** (gain_db / 20)
+
+
+def apply_gain(samples, gain):
+    """คูณความดังแล้วตัดไม่ให้เกินช่วง int16"""
+    if abs(gain - 1.0) < 0.06:  # ต่างกันไม่ถึง 0.5 dB ไม่ต้องแก้
+        return samples
+    scaled = samples.astype(np.float32) * gain
+    return np.clip(scaled, -32768, 32767).astype(np.int16)
+
+
+def plan_chunks(
+    regions,
+    energy_db,
+    target_frames,
+    max_frames,
+    min_frames,
+    search_frames=250,
+    overlap_frames=0,
+):
+    """จัดช่วงเสียงพูดเป็นกลุ่ม คืน (groups, overlapped)
+
+    groups คือ list ของกลุ่ม (แต่ละกลุ่มคือ list ของช่วง) และ overlapped[i] บอกว่า
+    กลุ่มที่ i เริ่มด้วยเสียงซ้ำกับท้ายกลุ่มก่อนหน้าหรือไม่
+    ช่วงที่ยาวเกิน max_frames ถูกตัดที่เฟรมเบาที่สุดก่อนถึง target_frames
+    และชิ้นถัดไปเริ่มก่อนจุดตัด overlap_frames (ตัดกลางเสียงพูดได้โดยไม่เสียคำ)
+    ช่วงสั้นๆ ถูกรวมต่อกันจนใกล้ target_frames (ไม่เกิน max_frames)
+    """
+    search_frames = min(search_frames, target_frames // 2)
+    overlap_frames = max(0, min(overlap_frames, target_frames - search_frames - 1))
+    pieces = []
+    for start, end in regions:
+        continued = False
+        while end - start > max_frames:
+            low = start + target_frames - search_frames
+            cut = low + int(np.argmin(energy_db[low : start + target_frames]))
+            pieces.append((start, cut, continued))
+            start = cut - overlap_frames
+            continued = overlap_frames > 0
+        pieces.append((start, end, continued))
+
+    groups = []
+    overlapped = []
+    current = []
+    current_frames = 0
+    for start, end, continued in pieces:
+        length = end - start
+        # ชิ้นที่ต่อจากจุดตัดต้องขึ้นส่วนใหม่เสมอ ช่วงเหลื่อมจะได้อยู่ที่รอยต่อพอดี
+        if current and (
+            continued
+            or current_frames >= target_frames
+            or current_frames + length > max_frames
+        ):
+            groups.append(current)
+            current, current_frames = [], 0
+        if not current:
+            overlapped.append(continued)
+        current.append((start, end))
+        current_frames += length
+
+    if current:
+        last_frames = sum(end - start for start, end in groups[-1]) if groups else 0
+        # กลุ่มสุดท้ายที่เหลื่อมกับกลุ่มก่อนหน้าห้ามรวมกลับ (เสียงจะซ้ำในส่วนเดียวกัน)
+        if (
+            groups
+            and not overlapped[-1]
+            and current_frames < min_frames
+            and last_frames + current_frames <= max_frames
+        ):
+            groups[-1].extend(current)
+            overlapped.pop()
+        else:
+            groups.append(current)
+    return groups, overlapped
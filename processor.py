@@ -0,0 +1,1913 @@
+"""
+processor.py - ส่วนประมวลผล (ถอดเสียง + สร้างโพสต์ด้วย Gemini)
+แยกจาก app.py เพื่อให้ worker process และสคริปต์อื่น import ได้โดยไม่รัน Streamlit
+"""
+
+import os
+import tempfile
+import time
+import wave
+import json
+import contextlib
+import functools
+import hashlib
+import logging
+import random
+import sqlite3
+import subprocess
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+
+import preprocess
+import stitch
+from asr import make_recognizer
+from lazy import LazyModule
+from metrics import PipelineMetrics
+
+# ไลบรารีหนัก import เมื่อใช้ครั้งแรก (หน้าแรกของแอปไม่ต้องใช้)
+sr = LazyModule("speech_recognition")
+pydub = LazyModule("pydub")
+pydub_silence = LazyModule("pydub.silence")
+genai = LazyModule("google.generativeai")
+google_exceptions = LazyModule("google.api_core.exceptions")
+ffmpeg = LazyModule("ffmpeg")
+np = LazyModule("numpy")
+
+logger = logging.getLogger("dhamma")
+
+
+def configure_logging(level=None):
+    """แสดง log ของ logger "dhamma" ทาง stderr (เรียกจาก entry point และ worker)
+
+    ระดับมาจาก DHAMMA_LOG_LEVEL (ค่าเริ่มต้น INFO) เรียกซ้ำได้โดยไม่เพิ่ม handler ซ้ำ
+    """
+    logger.setLevel(level or os.environ.get("DHAMMA_LOG_LEVEL", "INFO").upper())
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(
+            logging.Formatter("%(asctime)s %(levelname)s [%(processName)s] %(message)s")
+        )
+        logger.addHandler(handler)
+        # ไม่ส่งต่อให้ root logger (Streamlit ตั้ง handler ของตัวเองไว้)
+        logger.propagate = False
+
+
+class TokenBucket:
+    """จำกัดอัตราการเรียก API แบบ token bucket (ใช้ร่วมกันได้หลาย thread)"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self):
+        """รอจนกว่าจะได้ token 1 อัน"""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def set_rate(self, rate):
+        """เปลี่ยนอัตรา (token ที่สะสมไว้แล้วคิดตามอัตราเดิม)"""
+        with self._lock:
+            self._refill()
+            self.rate = float(rate)
+
+
+class CircuitBreaker:
+    """ชะลอทั้ง pool เมื่อ API เริ่มผิดพลาด
+
+    ผิดพลาดแต่ละครั้งลดอัตราของ rate limiter ลงครึ่งหนึ่ง (ไม่ต่ำกว่า min_rate)
+    ผิดพลาดติดกันครบ failure_threshold ครั้ง จะหยุดทุก thread ไว้ cooldown วินาที
+    เรียกสำเร็จแต่ละครั้งค่อยๆ คืนอัตรากลับสู่ค่าเดิม
+    """
+
+    def __init__(self, rate_limiter, failure_threshold=3, cooldown=15.0, min_rate=0.2):
+        self.rate_limiter = rate_limiter
+        self.base_rate = rate_limiter.rate
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.min_rate = min(min_rate, self.base_rate)
+        self._failures = 0
+        self._open_until = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """รอจนกว่าวงจรจะปิด (ถ้ากำลังพักอยู่)"""
+        with self._lock:
+            delay = self._open_until - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            rate = self.rate_limiter.rate
+            if rate < self.base_rate:
+                self.rate_limiter.set_rate(min(self.base_rate, rate * 1.25))
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self.rate_limiter.set_rate(
+                max(self.min_rate, self.rate_limiter.rate / 2)
+            )
+            if self._failures >= self.failure_threshold:
+                self._failures = 0
+                self._open_until = time.monotonic() + self.cooldown
+                logger.warning(
+                    "ASR circuit open: pausing %.0fs, rate %.2f/s",
+                    self.cooldown,
+                    self.rate_limiter.rate,
+                )
+
+
+CACHE_DIR = os.environ.get(
+    "DHAMMA_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "dhamma")
+)
+
+
+# ไฟล์ที่สั้นกว่านี้ถอดเป็นข้อความที่ใช้ได้ไม่ทัน (transcript ต้องยาว 20 ตัวอักษรขึ้นไป)
+MIN_MEDIA_SECONDS = 2.0
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv", ".flv", ".wmv", ".webm", ".m4v")
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".m4a", ".flac", ".aac")
+
+# เพิ่มเลขเวอร์ชันเมื่อแก้ prompt เพื่อไม่ให้ใช้คำตอบเก่าจากแคช
+PROMPT_VERSIONS = {
+    "post": 1,
+    "essence": 1,
+    "keywords": 1,
+    "combined": 2,
+    "window_summary": 1,
+}
+
+
+@functools.lru_cache(maxsize=None)
+def retryable_asr_errors():
+    """ข้อผิดพลาดชั่วคราวของการถอดเสียงที่ควรลองใหม่"""
+    return (sr.RequestError, ConnectionError, TimeoutError)
+
+
+@functools.lru_cache(maxsize=None)
+def retryable_gemini_errors():
+    """ข้อผิดพลาดชั่วคราวของ Gemini ที่ควรลองใหม่"""
+    return (
+        google_exceptions.ResourceExhausted,
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.DeadlineExceeded,
+        google_exceptions.InternalServerError,
+        ConnectionError,
+        TimeoutError,
+    )
+
+
+# ฟิลด์ที่ต้องมีในผลลัพธ์แบบเรียก Gemini ครั้งเดียว
+COMBINED_TEXT_FIELDS = (
+    "post",
+    "main_teaching",
+    "emotion",
+    "headline",
+    "essence_1",
+    "essence_2",
+    "essence_3",
+    "quote",
+)
+
+
+def file_sha256(file_path, block_size=1024 * 1024):
+    """คำนวณ SHA-256 ของไฟล์ทีละ block (ไม่โหลดทั้งไฟล์เข้าหน่วยความจำ)"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def spool_to_file(fileobj, suffix="", block_size=1024 * 1024):
+    """คัดลอก stream ลงไฟล์ชั่วคราวทีละ block และคำนวณ SHA-256 ในรอบเดียวกัน
+
+    คืน (path, sha256) หน่วยความจำที่ใช้มีแค่ 1 block ไม่ว่าไฟล์จะใหญ่แค่ไหน
+    """
+    digest = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_file:
+        for block in iter(lambda: fileobj.read(block_size), b""):
+            digest.update(block)
+            tmp_file.write(block)
+    return tmp_file.name, digest.hexdigest()
+
+
+class DiskCache:
+    """แคช JSON บนดิสก์ ลบรายการที่ใช้ล่าสุดนานที่สุดเมื่อเกินขนาด และหมดอายุตาม TTL"""
+
+    def __init__(self, directory, max_bytes=100 * 1024 * 1024, ttl_seconds=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(directory, exist_ok=True)
+
+        # ตัวนับ hit/miss เก็บใน SQLite เพื่อรวมทุก process และคงอยู่ข้ามการรีสตาร์ท
+        self._stats_path = os.path.join(directory, "_stats.sqlite3")
+        with self._stats_db() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS stats "
+                "(name TEXT PRIMARY KEY, value INTEGER)"
+            )
+            db.executemany(
+                "INSERT OR IGNORE INTO stats VALUES (?, 0)", [("hits",), ("misses",)]
+            )
+
+    @contextlib.contextmanager
+    def _stats_db(self):
+        db = sqlite3.connect(self._stats_path, timeout=10)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _count(self, name):
+        try:
+            with self._stats_db() as db:
+                db.execute("UPDATE stats SET value = value + 1 WHERE name = ?", (name,))
+        except sqlite3.Error:
+            pass
+
+    def _read_count(self, name):
+        with self._stats_db() as db:
+            row = db.execute(
+                "SELECT value FROM stats WHERE name = ?", (name,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    @property
+    def hits(self):
+        return self._read_count("hits")
+
+    @property
+    def misses(self):
+        return self._read_count("misses")
+
+    @staticmethod
+    def make_key(*parts):
+        """สร้าง key จากส่วนประกอบใดๆ ที่แปลงเป็น JSON ได้"""
+        raw = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self._count("misses")
+            return None
+
+        expired = (
+            self.ttl_seconds is not None
+            and time.time() - entry.get("created_at", 0) > self.ttl_seconds
+        )
+        if expired:
+            self._remove(path)
+            self._count("misses")
+            return None
+
+        # mtime ใช้เป็นเวลาที่ถูกใช้ล่าสุดสำหรับ LRU
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        self._count("hits")
+        return entry["value"]
+
+    def set(self, key, value):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"created_at": time.time(), "value": value}, f, ensure_ascii=False
+            )
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _evict(self):
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith(".json"):
+                    continue
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def clear(self):
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".json"):
+                    self._remove(entry.path)
+
+
+class ChunkCheckpointStore:
+    """ผลถอดเสียงรายส่วนที่เสร็จแล้ว (SQLite) ให้ไฟล์ที่ล้มเหลวกลางทางทำต่อได้
+
+    file_key ระบุไฟล์ + ค่าการถอดเสียง  chunk_key ระบุขอบเขตของส่วนนั้นในไฟล์
+    """
+
+    def __init__(self, path, ttl_seconds=7 * 24 * 3600):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._db() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS chunks (file_key TEXT, chunk_key TEXT, "
+                "text TEXT, created_at REAL, PRIMARY KEY (file_key, chunk_key))"
+            )
+            db.execute(
+                "DELETE FROM chunks WHERE created_at < ?", (time.time() - ttl_seconds,)
+            )
+
+    @contextlib.contextmanager
+    def _db(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def load(self, file_key):
+        """คืน dict chunk_key -> ข้อความ (None = ส่วนที่ไม่มีเสียงพูด)"""
+        with self._db() as db:
+            rows = db.execute(
+                "SELECT chunk_key, text FROM chunks WHERE file_key = ?", (file_key,)
+            ).fetchall()
+        return dict(rows)
+
+    def save(self, file_key, chunk_key, text):
+        with self._db() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?)",
+                (file_key, chunk_key, text, time.time()),
+            )
+
+    def clear(self, file_key):
+        with self._db() as db:
+            db.execute("DELETE FROM chunks WHERE file_key = ?", (file_key,))
+
+
+def open_checkpoint_store():
+    """checkpoint รายส่วน (ทุก process เปิดไฟล์เดียวกัน)"""
+    return ChunkCheckpointStore(os.path.join(CACHE_DIR, "checkpoints.sqlite3"))
+
+
+def open_transcript_cache():
+    """แคช transcript (ทุก process เปิด directory เดียวกัน)"""
+    return DiskCache(
+        os.path.join(CACHE_DIR, "transcripts"),
+        max_bytes=200 * 1024 * 1024,
+        ttl_seconds=30 * 24 * 3600,
+    )
+
+
+def open_llm_cache():
+    """แคชคำตอบ Gemini (ทุก process เปิด directory เดียวกัน)"""
+    return DiskCache(
+        os.path.join(CACHE_DIR, "llm"),
+        max_bytes=50 * 1024 * 1024,
+        ttl_seconds=7 * 24 * 3600,
+    )
+
+
+class DecodedAudio:
+    """เสียงที่ถอดรหัสครั้งเดียวเป็น PCM 16 kHz mono แล้วใช้ร่วมกันทุกขั้นตอน"""
+
+    SAMPLE_RATE = 16000
+    SAMPLE_WIDTH = 2
+
+    def __init__(self, pcm, source_path=None):
+        self.pcm = pcm
+        self.source_path = source_path
+
+    @classmethod
+    def is_native(cls, media_info):
+        """ไฟล์เป็น WAV PCM 16-bit 16 kHz mono อยู่แล้ว (อ่านตรงได้ ไม่ต้อง resample)"""
+        return (
+            media_info is not None
+            and "wav" in media_info["format"].split(",")
+            and not media_info["has_video"]
+            and media_info["audio_codec"] == "pcm_s16le"
+            and media_info["sample_rate"] == cls.SAMPLE_RATE
+            and media_info["channels"] == 1
+        )
+
+    @classmethod
+    def from_file(cls, file_path, media_info=None):
+        """ถอดรหัสไฟล์เสียง/วิดีโอใดๆ ผ่าน ffmpeg pipe (ไม่เขียนไฟล์กลาง)
+
+        ถ้า media_info บอกว่าเป็นรูปแบบที่ใช้อยู่แล้ว จะอ่าน PCM จาก WAV ตรงๆ
+        header ที่ wave อ่านไม่ได้ (เช่น WAVE_FORMAT_EXTENSIBLE) ถอดรหัสผ่าน ffmpeg แทน
+        """
+        if cls.is_native(media_info):
+            try:
+                with wave.open(file_path, "rb") as f:
+                    if (
+                        f.getsampwidth() == cls.SAMPLE_WIDTH
+                        and f.getframerate() == cls.SAMPLE_RATE
+                        and f.getnchannels() == 1
+                    ):
+                        return cls(f.readframes(f.getnframes()), file_path)
+            except (wave.Error, EOFError):
+                pass
+
+        try:
+            pcm, _ = (
+                ffmpeg.input(file_path)
+                .output(
+                    "pipe:",
+                    format="s16le",
+                    acodec="pcm_s16le",
+                    ac=1,
+                    ar=str(cls.SAMPLE_RATE),
+                )
+                .run(capture_stdout=True, capture_stderr=True)
+            )
+        except ffmpeg.Error as e:
+            raise Exception(
+                f"ไม่สามารถอ่านเสียงจากไฟล์ได้: {e.stderr.decode() if e.stderr else str(e)}"
+            )
+        return cls(pcm, file_path)
+
+    @property
+    def duration(self):
+        """ความยาว (วินาที) คำนวณจากขนาด PCM ไม่ต้องถอดรหัสซ้ำ"""
+        return len(self.pcm) / (self.SAMPLE_RATE * self.SAMPLE_WIDTH)
+
+    def to_segment(self):
+        return pydub.AudioSegment(
+            data=self.pcm,
+            sample_width=self.SAMPLE_WIDTH,
+            frame_rate=self.SAMPLE_RATE,
+            channels=1,
+        )
+
+    def to_audio_data(self):
+        return sr.AudioData(self.pcm, self.SAMPLE_RATE, self.SAMPLE_WIDTH)
+
+
+class PlannedChunks:
+    """ส่วนเสียงที่วางแผนไว้แล้ว สร้าง AudioSegment ทีละส่วนเมื่อวนถึง
+
+    รู้จำนวนส่วนและความยาวเสียงรวมโดยไม่ต้องสร้างสำเนา PCM ของทุกส่วนพร้อมกัน
+    """
+
+    def __init__(self, groups, build, frame_ms):
+        self.groups = groups
+        self.build = build
+        frames = sum(end - start for group in groups for start, end in group)
+        self.speech_ms = frames * frame_ms
+
+    def __len__(self):
+        return len(self.groups)
+
+    def __iter__(self):
+        for group in self.groups:
+            yield self.build(group)
+
+
+class DhammaPostCreator:
+    def __init__(
+        self,
+        gemini_api_key,
+        max_workers=4,
+        requests_per_second=2.0,
+        stream_video=True,
+        transcript_cache=None,
+        llm_cache=None,
+        model_name="gemini-2.5-flash",
+        combined_generation=True,
+        llm_timeout=120,
+        llm_retries=3,
+        map_reduce_threshold_chars=30000,
+        map_reduce_window_chars=12000,
+        asr_engine="google",
+        whisper_model="small",
+        asr_retries=4,
+        checkpoint_store=None,
+        preprocess_audio=True,
+        chunk_target_ms=30000,
+        chunk_max_ms=50000,
+        chunk_overlap_ms=2000,
+        record_metrics=True,
+    ):
+        self.max_workers = max(1, int(max_workers))
+        self.stream_video = stream_video
+        self.transcript_cache = transcript_cache
+        self.llm_cache = llm_cache
+        self.checkpoint_store = checkpoint_store
+        # เตรียมเสียงด้วย NumPy (VAD + ปรับความดัง) แทน split_on_silence ของ pydub
+        self.preprocess_audio = preprocess_audio
+        # ขนาดส่วนที่ส่งถอดเสียง และช่วงเหลื่อมเมื่อจำเป็นต้องตัดกลางเสียงพูด
+        # (ข้อความซ้ำตรงช่วงเหลื่อมถูกรวมด้วย stitch.py จึงใช้ส่วนที่ยาวขึ้นได้)
+        self.chunk_target_ms = chunk_target_ms
+        self.chunk_max_ms = max(chunk_max_ms, chunk_target_ms)
+        self.chunk_overlap_ms = chunk_overlap_ms
+        self.model_name = model_name
+        self.combined_generation = combined_generation
+        self.llm_timeout = llm_timeout
+        self.llm_retries = llm_retries
+        self.map_reduce_threshold_chars = map_reduce_threshold_chars
+        self.map_reduce_window_chars = map_reduce_window_chars
+        self.rate_limiter = TokenBucket(requests_per_second, capacity=self.max_workers)
+        self.circuit_breaker = CircuitBreaker(self.rate_limiter)
+        self.asr_retries = asr_retries
+
+        # เวลา/ทรัพยากรของแต่ละขั้นตอน ถูก reset ทุกครั้งที่เริ่ม process_file
+        # หรือ continue_processing (1 instance ควรทำงานทีละ 1 ไฟล์)
+        # record_metrics=False สำหรับ instance ที่ใช้ร่วมกันเพื่อ probe เท่านั้น
+        self.metrics = PipelineMetrics(enabled=record_metrics)
+
+        # เครื่องถอดเสียง: "google" (ออนไลน์) หรือ "whisper" (ในเครื่อง)
+        # สร้างเมื่อถอดเสียงครั้งแรก instance ที่ใช้ probe อย่างเดียวจึงไม่ต้องโหลด
+        self._asr_args = (asr_engine, whisper_model)
+        self._asr = None
+        self._asr_lock = threading.Lock()
+
+        # สร้าง GenerativeModel เมื่อเรียก Gemini ครั้งแรก (หน้า UI ส่วนใหญ่ไม่ต้องใช้)
+        self._gemini_api_key = gemini_api_key
+        self._gemini_model = None
+        self._gemini_lock = threading.Lock()
+
+    @property
+    def gemini_model(self):
+        with self._gemini_lock:
+            if self._gemini_model is None:
+                genai.configure(api_key=self._gemini_api_key)
+                self._gemini_model = genai.GenerativeModel(self.model_name)
+            return self._gemini_model
+
+    @gemini_model.setter
+    def gemini_model(self, model):
+        with self._gemini_lock:
+            self._gemini_model = model
+
+    @property
+    def asr(self):
+        with self._asr_lock:
+            if self._asr is None:
+                engine, whisper_model = self._asr_args
+                self._asr = make_recognizer(
+                    engine, whisper_model=whisper_model, num_workers=self.max_workers
+                )
+            return self._asr
+
+    @asr.setter
+    def asr(self, recognizer):
+        with self._asr_lock:
+            self._asr = recognizer
+
+    def probe_media(self, file_path):
+        """อ่านข้อมูลไฟล์เสียง/วิดีโอจาก header ด้วย ffprobe (ไม่ถอดรหัสเสียง)
+
+        คืน dict: duration, format, has_audio, has_video, audio_codec,
+        sample_rate, channels และ size (กว้าง, สูง) ถ้าเป็นวิดีโอ
+        """
+        try:
+            with self.metrics.stage("probe"):
+                probe = ffmpeg.probe(file_path)
+        except ffmpeg.Error as e:
+            raise Exception(
+                f"ไม่สามารถอ่านข้อมูลไฟล์ได้: {e.stderr.decode() if e.stderr else str(e)}"
+            )
+
+        video = next(
+            (s for s in probe["streams"] if s.get("codec_type") == "video"), None
+        )
+        audio = next(
+            (s for s in probe["streams"] if s.get("codec_type") == "audio"), None
+        )
+        # ภาพปก (cover art) ใน mp3/m4a ถูกรายงานเป็น video stream
+        if video is not None and video.get("disposition", {}).get("attached_pic"):
+            video = None
+
+        duration = probe["format"].get("duration")
+        if duration is None and audio is not None:
+            duration = audio.get("duration")
+
+        return {
+            "duration": float(duration) if duration is not None else None,
+            "format": probe["format"].get("format_name", ""),
+            "has_audio": audio is not None,
+            "has_video": video is not None,
+            "audio_codec": audio.get("codec_name") if audio else None,
+            "sample_rate": int(audio.get("sample_rate", 0)) if audio else None,
+            "channels": audio.get("channels") if audio else None,
+            "size": (int(video["width"]), int(video["height"])) if video else None,
+        }
+
+    def validate_media(self, media_info):
+        """ปฏิเสธไฟล์ที่ไม่มีเสียงหรือสั้นเกินไป ก่อนเริ่มถอดรหัส"""
+        if not media_info["has_audio"]:
+            if media_info["has_video"]:
+                raise Exception("วิดีโอนี้ไม่มีเสียง กรุณาอัปโหลดไฟล์ที่มีเสียง")
+            raise Exception("ไม่พบเสียงในไฟล์ กรุณาตรวจสอบไฟล์")
+        if media_info["duration"] is not None and (
+            media_info["duration"] < MIN_MEDIA_SECONDS
+        ):
+            raise Exception(
+                f"ไฟล์สั้นเกินไป ({media_info['duration']:.1f} วินาที) "
+                f"ต้องยาวอย่างน้อย {MIN_MEDIA_SECONDS:.0f} วินาที"
+            )
+
+    def is_video_file(self, file_path):
+        """ตรวจสอบว่าเป็นไฟล์วิดีโอหรือไม่"""
+        file_extension = os.path.splitext(file_path)[1].lower()
+        return file_extension in VIDEO_EXTENSIONS
+
+    def decode_audio(self, file_path, progress_callback=None, media_info=None):
+        """ถอดรหัสไฟล์ครั้งเดียวเป็น DecodedAudio"""
+        if media_info is not None:
+            is_video = media_info["has_video"]
+        else:
+            is_video = self.is_video_file(file_path)
+
+        if progress_callback:
+            if is_video:
+                progress_callback("🎬 กำลังแยกเสียงจากวิดีโอ...")
+            else:
+                progress_callback("🔄 กำลังแปลงไฟล์เสียง...")
+
+        stage = "extraction" if is_video else "conversion"
+        with self.metrics.stage(
+            stage,
+            bytes_processed=os.path.getsize(file_path),
+            native=DecodedAudio.is_native(media_info),
+        ):
+            return DecodedAudio.from_file(file_path, media_info)
+
+    def speech_to_text_short(self, audio, progress_callback=None):
+        """แปลงเสียงสั้น (DecodedAudio) ในครั้งเดียว"""
+        if progress_callback:
+            progress_callback("🎤 กำลังแปลงเสียงเป็นข้อความ...")
+
+        audio_data = audio.to_audio_data()
+
+        try:
+            with self.metrics.stage("asr_chunk", bytes_processed=len(audio.pcm)):
+                text = self._recognize_with_retry([audio_data])[0]
+        except sr.RequestError as e:
+            raise Exception(f"ไม่สามารถเชื่อมต่อ Google Speech API: {e}")
+
+        if not text:
+            raise Exception("ไม่สามารถรู้จำเสียงได้ กรุณาตรวจสอบคุณภาพเสียง")
+        return text
+
+    def _transcribe_decoded(
+        self, audio, progress_callback=None, warning_callback=None, file_key=None
+    ):
+        """แบ่งเสียงยาว (DecodedAudio) เป็นส่วนๆ แล้วถอด คืน (ข้อความ, overlapped)"""
+        if progress_callback:
+            progress_callback("📊 กำลังแบ่งไฟล์เสียงเป็นส่วนๆ...")
+
+        chunks, overlapped = self.split_decoded_audio(audio)
+
+        if progress_callback:
+            speech_ms = getattr(chunks, "speech_ms", None)
+            if speech_ms is None:
+                speech_ms = sum(len(c) for c in chunks)
+            speech_seconds = speech_ms / 1000
+            progress_callback(
+                f"📊 แบ่งได้ {len(chunks)} ส่วน "
+                f"(เสียงพูด {speech_seconds:.0f}/{audio.duration:.0f} วินาที)"
+            )
+
+        chunk_texts = self._transcribe_chunks(
+            chunks, progress_callback, warning_callback, file_key
+        )
+        return chunk_texts, overlapped
+
+    def split_decoded_audio(self, audio):
+        """แบ่ง DecodedAudio เป็นส่วนๆ ตามการตั้งค่า preprocess_audio
+
+        คืน (chunks, overlapped) โดย overlapped[i] บอกว่าส่วนที่ i เริ่มด้วย
+        เสียงซ้ำกับท้ายส่วนก่อนหน้า (ตัดกลางเสียงพูด) หรือไม่
+        """
+        with self.metrics.stage("chunking", bytes_processed=len(audio.pcm)):
+            if self.preprocess_audio:
+                return self.split_audio_vad(audio)
+            return self.split_audio_on_pauses(
+                audio.to_segment(),
+                target_chunk_ms=self.chunk_target_ms,
+                max_chunk_ms=self.chunk_max_ms,
+                overlap_ms=self.chunk_overlap_ms,
+            )
+
+    def split_audio_vad(self, audio, min_chunk_ms=5000):
+        """แบ่งเสียงด้วย energy VAD บน NumPy คืน (PlannedChunks, overlapped)
+
+        noise floor และความดังคำนวณครั้งเดียวจากทั้งไฟล์ แต่ละส่วนมีเฉพาะช่วงเสียงพูด
+        (เผื่อหัวท้าย 300 ms) ช่วงเงียบยาวและส่วนที่ไม่มีเสียงพูดจึงไม่ถูกส่งไปถอด
+        ช่วงพูดยาวที่ต้องตัดกลางจะเหลื่อมกัน chunk_overlap_ms
+        ถ้า VAD พบเสียงพูดน้อยผิดปกติ จะถือว่าทั้งไฟล์เป็นเสียงพูด (ตัดตามความยาว)
+        AudioSegment ของแต่ละส่วนถูกสร้างเมื่อวนถึงเท่านั้น (ไม่สำเนาทั้งไฟล์ล่วงหน้า)
+        """
+        frame_ms = preprocess.FRAME_MS
+        frame = DecodedAudio.SAMPLE_RATE * frame_ms // 1000
+        samples = np.frombuffer(audio.pcm, dtype=np.int16)
+
+        energy_db = preprocess.frame_energy_db(samples, DecodedAudio.SAMPLE_RATE)
+        if not len(energy_db):
+            return [], []
+        floor_db = preprocess.estimate_noise_floor(energy_db)
+        regions = preprocess.speech_regions(energy_db, floor_db)
+        speech_frames = sum(end - start for start, end in regions)
+        if not preprocess.speech_is_plausible(speech_frames, len(energy_db)):
+            logger.warning(
+                "VAD found speech in %d/%d frames, using fixed-length chunks",
+                speech_frames,
+                len(energy_db),
+            )
+            regions = [(0, len(energy_db))]
+        gain = preprocess.speech_gain(energy_db, regions)
+
+        groups, overlapped = preprocess.plan_chunks(
+            regions,
+            energy_db,
+            self.chunk_target_ms // frame_ms,
+            self.chunk_max_ms // frame_ms,
+            min_chunk_ms // frame_ms,
+            overlap_frames=self.chunk_overlap_ms // frame_ms,
+        )
+
+        def build(group):
+            pcm = np.concatenate(
+                [samples[start * frame : end * frame] for start, end in group]
+            )
+            return pydub.AudioSegment(
+                data=preprocess.apply_gain(pcm, gain).tobytes(),
+                sample_width=DecodedAudio.SAMPLE_WIDTH,
+                frame_rate=DecodedAudio.SAMPLE_RATE,
+                channels=1,
+            )
+
+        return PlannedChunks(groups, build, frame_ms), overlapped
+
+    def clean_stream_windows(self, windows):
+        """เตรียมเสียงแต่ละคู่ (ช่วง, overlapped) จาก stream_audio_windows
+
+        noise floor เป็นค่าต่ำสุดที่เห็นมาตั้งแต่ต้นไฟล์ (ไม่ต้องรอทั้งไฟล์)
+        ช่วงที่ไม่มีเสียงพูดถูกข้าม และตัดช่วงเงียบหัวท้ายออก
+        รอยต่อยังนับว่าเหลื่อมกันก็ต่อเมื่อช่วงก่อนหน้าไม่ถูกข้าม และการตัดหัวท้าย
+        ไม่ได้ตัดเสียงช่วงเหลื่อมทิ้ง
+
+        ช่วงแรกๆ ถูกพักไว้จนได้เสียงครบ 60 วินาที ถ้าถึงตอนนั้นเสียงพูดที่พบรวม
+        น้อยผิดปกติ (VAD ใช้ไม่ได้กับไฟล์นี้) จะส่งช่วงนั้นไปทั้งช่วงแทนการข้าม
+        """
+        frame_ms = preprocess.FRAME_MS
+        frame = DecodedAudio.SAMPLE_RATE * frame_ms // 1000
+        floor_db = None
+        tail_kept = False
+        total_frames = speech_frames = 0
+        held = []
+
+        def clean(samples, energy_db, regions, overlapped, fallback):
+            nonlocal tail_kept
+            if fallback:
+                regions = [(0, len(energy_db))]
+            if not regions:
+                tail_kept = False
+                return None
+
+            first, last = regions[0][0], regions[-1][1]
+            head_kept = first * frame_ms < self.chunk_overlap_ms
+            seam = overlapped and tail_kept and head_kept
+            tail_kept = (len(energy_db) - last) * frame_ms < self.chunk_overlap_ms
+
+            gain = preprocess.speech_gain(energy_db, regions)
+            pcm = preprocess.apply_gain(samples[first * frame : last * frame], gain)
+            segment = pydub.AudioSegment(
+                data=pcm.tobytes(),
+                sample_width=DecodedAudio.SAMPLE_WIDTH,
+                frame_rate=DecodedAudio.SAMPLE_RATE,
+                channels=1,
+            )
+            return segment, seam
+
+        def release():
+            fallback = not preprocess.speech_is_plausible(speech_frames, total_frames)
+            for item in held:
+                cleaned = clean(*item, fallback)
+                if cleaned is not None:
+                    yield cleaned
+            held.clear()
+
+        for window, overlapped in windows:
+            samples = np.frombuffer(window.raw_data, dtype=np.int16)
+            energy_db = preprocess.frame_energy_db(samples, DecodedAudio.SAMPLE_RATE)
+            if not len(energy_db):
+                continue
+
+            window_floor = preprocess.estimate_noise_floor(energy_db)
+            floor_db = window_floor if floor_db is None else min(floor_db, window_floor)
+            regions = preprocess.speech_regions(energy_db, floor_db)
+
+            total_frames += len(energy_db)
+            speech_frames += sum(end - start for start, end in regions)
+            held.append((samples, energy_db, regions, overlapped))
+            if total_frames >= preprocess.VAD_FALLBACK_FRAMES:
+                yield from release()
+
+        yield from release()
+
+    def split_audio_on_pauses(
+        self,
+        audio,
+        target_chunk_ms=30000,
+        max_chunk_ms=50000,
+        min_chunk_ms=5000,
+        min_silence_len=700,
+        silence_thresh_offset=16,
+        keep_silence=300,
+        overlap_ms=0,
+    ):
+        """แบ่งเสียงตรงช่วงเงียบใกล้ความยาวเป้าหมาย ตัดช่วงเงียบยาวทิ้ง
+
+        คืน (chunks, overlapped) แบบเดียวกับ split_decoded_audio
+        """
+        if audio.dBFS == float("-inf"):
+            return [], []
+
+        segments = pydub_silence.split_on_silence(
+            audio,
+            min_silence_len=min_silence_len,
+            silence_thresh=audio.dBFS - silence_thresh_offset,
+            keep_silence=keep_silence,
+            seek_step=10,
+        )
+
+        # ส่วนที่ไม่มีช่วงหยุดเลยและยาวเกิน ต้องตัดแบบตายตัว (ชิ้นถัดไปเหลื่อมกัน)
+        pieces = []
+        for segment in segments:
+            if len(segment) > max_chunk_ms:
+                step = target_chunk_ms - overlap_ms
+                for i in range(0, len(segment) - overlap_ms, step):
+                    pieces.append((segment[i : i + target_chunk_ms], i > 0))
+            else:
+                pieces.append((segment, False))
+
+        # รวมส่วนสั้นๆ ต่อกันจนใกล้ความยาวเป้าหมาย
+        # ชิ้นที่เหลื่อมกับชิ้นก่อนหน้าขึ้นส่วนใหม่เสมอ (ไม่ส่งเสียงซ้ำในส่วนเดียวกัน)
+        chunks = []
+        overlapped = []
+        current = None
+        for piece, continued in pieces:
+            if current is None:
+                current = piece
+                overlapped.append(continued)
+            elif (
+                not continued
+                and len(current) < target_chunk_ms
+                and len(current) + len(piece) <= max_chunk_ms
+            ):
+                current += piece
+            else:
+                chunks.append(current)
+                current = piece
+                overlapped.append(continued)
+
+        if current is not None:
+            if (
+                chunks
+                and not overlapped[-1]
+                and len(current) < min_chunk_ms
+                and len(chunks[-1]) + len(current) <= max_chunk_ms
+            ):
+                chunks[-1] += current
+                overlapped.pop()
+            else:
+                chunks.append(current)
+
+        return chunks, overlapped
+
+    def _recognize_batch(self, chunks):
+        """ถอดเสียงหลายส่วนจาก PCM ในหน่วยความจำ (เรียกจาก worker thread)
+
+        backend ที่ถูกจำกัดอัตราจะมี batch_size = 1 จึงขอ token ทีละส่วน
+        """
+        chunks = [chunk.set_channels(1) for chunk in chunks]
+        audio_list = [
+            sr.AudioData(chunk.raw_data, chunk.frame_rate, chunk.sample_width)
+            for chunk in chunks
+        ]
+
+        with self.metrics.stage(
+            "asr_chunk",
+            bytes_processed=sum(len(chunk.raw_data) for chunk in chunks),
+            per_thread=True,
+            engine=self.asr.name,
+            chunks=len(chunks),
+        ):
+            return self._recognize_with_retry(audio_list)
+
+    def _recognize_with_retry(self, audio_list):
+        """เรียก backend พร้อมลองใหม่แบบ exponential backoff + jitter
+
+        ทุกความผิดพลาดถูกแจ้งให้ circuit breaker เพื่อชะลอ thread อื่นด้วย
+        """
+        for attempt in range(self.asr_retries + 1):
+            self.circuit_breaker.wait()
+            if self.asr.rate_limited:
+                for _ in audio_list:
+                    self.rate_limiter.acquire()
+            try:
+                texts = self.asr.recognize_batch(audio_list)
+            except retryable_asr_errors():
+                self.circuit_breaker.record_failure()
+                if attempt == self.asr_retries:
+                    raise
+                record = self.metrics.current()
+                if record is not None:
+                    record["retries"] += 1
+                time.sleep(random.uniform(0, min(30.0, 1.0 * 2**attempt)))
+            else:
+                self.circuit_breaker.record_success()
+                return texts
+
+    @staticmethod
+    def _chunk_key(index, chunk):
+        """ระบุขอบเขตของส่วน: ลำดับ + ความยาว + digest ของ PCM
+
+        split_on_silence ไม่คืนตำแหน่งเวลา จึงใช้เนื้อเสียงแทน
+        (ถอดรหัสไฟล์เดิมด้วยค่าเดิมได้ PCM และการแบ่งส่วนเหมือนเดิมทุกครั้ง)
+        """
+        digest = hashlib.sha1(chunk.raw_data).hexdigest()[:16]
+        return f"{index}:{len(chunk.raw_data)}:{digest}"
+
+    def _transcribe_chunks(
+        self, chunks, progress_callback=None, warning_callback=None, file_key=None
+    ):
+        """ถอดเสียงหลายส่วนพร้อมกันด้วย thread pool คืน list ข้อความตามลำดับเดิม
+
+        ส่วนที่ถอดไม่ได้จะเป็น None  chunks เป็น list หรือ generator ก็ได้
+        ส่วนที่ผิดพลาดแม้ลองใหม่แล้ว จะถูกลองอีกรอบหลังส่วนอื่นเสร็จหมด
+        จำนวนงานที่ค้างอยู่ถูกจำกัดไว้ เพื่อให้หน่วยความจำคงที่เมื่อรับแบบ streaming
+        ถ้ามี checkpoint_store และ file_key ส่วนที่เคยถอดเสร็จแล้วจะไม่ถูกส่งซ้ำ
+        """
+        total_chunks = len(chunks) if hasattr(chunks, "__len__") else None
+        batch_size = max(1, self.asr.batch_size)
+        max_pending = self.max_workers * 2
+        results = {}
+        errors = {}
+        pending = {}
+        failed_chunks = {}
+
+        store = self.checkpoint_store if file_key else None
+        saved = store.load(file_key) if store else {}
+        chunk_keys = {}
+        resumed = 0
+
+        def save(i, text):
+            # เรียกจาก thread หลักเท่านั้น บันทึกทันทีที่ส่วนนั้นเสร็จ
+            if store:
+                store.save(file_key, chunk_keys[i], text)
+
+        def collect(return_when):
+            done_futures, _ = wait(pending, return_when=return_when)
+            for future in done_futures:
+                indices, batch_chunks = pending.pop(future)
+                try:
+                    for i, text in zip(indices, future.result()):
+                        results[i] = text
+                        save(i, text)
+                except Exception as e:
+                    errors.update((i, e) for i in indices)
+                    # เก็บไว้ลองใหม่รอบสุดท้าย (เฉพาะส่วนที่ล้มเหลว)
+                    failed_chunks.update(zip(indices, batch_chunks))
+
+                # callback ต้องเรียกจาก thread หลักเท่านั้น (เช่น อัปเดต UI)
+                if progress_callback:
+                    done = len(results) + len(errors)
+                    if total_chunks:
+                        progress_callback(
+                            f"🎤 กำลังประมวลผลส่วนที่ {done}/{total_chunks}..."
+                        )
+                    else:
+                        progress_callback(f"🎤 ประมวลผลแล้ว {done} ส่วน...")
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            batch = []
+            for i, chunk in enumerate(chunks, 1):
+                if store:
+                    chunk_keys[i] = self._chunk_key(i, chunk)
+                    if chunk_keys[i] in saved:
+                        results[i] = saved[chunk_keys[i]]
+                        resumed += 1
+                        continue
+                batch.append((i, chunk))
+                if len(batch) < batch_size:
+                    continue
+                indices, batch_chunks = zip(*batch)
+                future = executor.submit(self._recognize_batch, batch_chunks)
+                pending[future] = (indices, batch_chunks)
+                batch = []
+                if len(pending) >= max_pending:
+                    collect(FIRST_COMPLETED)
+
+            if batch:
+                indices, batch_chunks = zip(*batch)
+                future = executor.submit(self._recognize_batch, batch_chunks)
+                pending[future] = (indices, batch_chunks)
+
+            while pending:
+                collect(FIRST_COMPLETED)
+
+        if resumed and progress_callback:
+            progress_callback(f"⏩ ใช้ผลที่ถอดไว้แล้วจากครั้งก่อน {resumed} ส่วน")
+
+        # รอบสุดท้าย: ลองส่วนที่ล้มเหลวอีกครั้งทีละส่วน หลังจาก pool ว่างแล้ว
+        if failed_chunks and progress_callback:
+            progress_callback(
+                f"🔁 กำลังลองส่วนที่ล้มเหลวอีกครั้ง {len(failed_chunks)} ส่วน..."
+            )
+        total = len(results) + len(errors)
+        for i in sorted(failed_chunks):
+            try:
+                results[i] = self._recognize_batch([failed_chunks[i]])[0]
+                save(i, results[i])
+                del errors[i]
+            except Exception as e:
+                errors[i] = e
+
+        for i in sorted(errors):
+            logger.warning("skipped chunk %d: %s", i, errors[i])
+            if warning_callback:
+                warning_callback(f"ข้ามส่วนที่ {i}: {errors[i]}")
+
+        return [results.get(i) for i in range(1, total + 1)]
+
+    def stream_audio_windows(
+        self, file_path, window_ms=None, search_ms=5000, warning_callback=None
+    ):
+        """อ่าน PCM 16 kHz mono จาก ffmpeg pipe ทีละช่วง ขณะที่ ffmpeg ยังถอดรหัสอยู่
+
+        แต่ละช่วงถูกตัดตรงจุดที่เงียบที่สุดในช่วง search_ms ก่อนถึง window_ms
+        (ค่าเริ่มต้น chunk_target_ms) และช่วงถัดไปเริ่มก่อนจุดตัด chunk_overlap_ms
+        yield คู่ (AudioSegment, overlapped) แบบเดียวกับ split_decoded_audio
+
+        ถ้า ffmpeg จบด้วย error หลังส่งเสียงมาบางส่วนแล้ว จะแจ้ง warning_callback
+        (transcript ไม่ครบ จึงไม่ถูกเก็บแคช) ถ้ายังไม่ได้เสียงเลยจะ raise
+        """
+        window_ms = window_ms or self.chunk_target_ms
+        bytes_per_ms = DecodedAudio.SAMPLE_RATE * DecodedAudio.SAMPLE_WIDTH // 1000
+        window_bytes = window_ms * bytes_per_ms
+        search_bytes = search_ms * bytes_per_ms
+        overlap_bytes = min(self.chunk_overlap_ms, window_ms - search_ms) * bytes_per_ms
+        frame_ms = 20
+
+        args = (
+            ffmpeg.input(file_path)
+            .output(
+                "pipe:",
+                format="s16le",
+                acodec="pcm_s16le",
+                ac=1,
+                ar=str(DecodedAudio.SAMPLE_RATE),
+            )
+            .global_args("-nostdin", "-loglevel", "error")
+            .compile()
+        )
+        # stderr ลงไฟล์ชั่วคราว: ถ้าเป็น pipe ที่ไม่มีใครอ่าน ไฟล์เสียหายที่ log error
+        # เกิน buffer ของ pipe (~64 KB) จะทำให้ ffmpeg ค้าง และ stdout.read ค้างตาม
+        stderr_file = tempfile.TemporaryFile()
+        process = subprocess.Popen(
+            args,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=stderr_file,
+        )
+
+        def read_stderr(limit=500):
+            stderr_file.seek(0, os.SEEK_END)
+            stderr_file.seek(max(0, stderr_file.tell() - limit))
+            return stderr_file.read().decode(errors="ignore").strip()
+
+        def to_segment(pcm):
+            return pydub.AudioSegment(
+                data=pcm,
+                sample_width=DecodedAudio.SAMPLE_WIDTH,
+                frame_rate=DecodedAudio.SAMPLE_RATE,
+                channels=1,
+            )
+
+        buffer = b""
+        total_bytes = 0
+        overlapped = False
+        try:
+            while True:
+                ready = []
+                # วัดเฉพาะการอ่าน pipe และการตัดช่วง ไม่รวมเวลาที่ผู้เรียกใช้กับ
+                # แต่ละช่วง (รอถอดเสียง) CPU จึงนับเฉพาะ thread นี้
+                with self.metrics.stage("extraction", per_thread=True) as record:
+                    data = process.stdout.read(window_bytes)
+                    record["bytes"] = len(data)
+                    total_bytes += len(data)
+                    buffer += data
+
+                    while len(buffer) >= window_bytes + search_bytes:
+                        search = to_segment(
+                            buffer[window_bytes - search_bytes : window_bytes]
+                        )
+                        quietest = min(
+                            range(0, search_ms, frame_ms),
+                            key=lambda ms: search[ms : ms + frame_ms].rms,
+                        )
+                        cut = window_bytes - search_bytes + quietest * bytes_per_ms
+                        ready.append((to_segment(buffer[:cut]), overlapped))
+                        buffer = buffer[cut - overlap_bytes :]
+                        overlapped = overlap_bytes > 0
+
+                    if not data and buffer:
+                        ready.append((to_segment(buffer), overlapped))
+                        buffer = b""
+
+                yield from ready
+                if not data:
+                    break
+
+            process.wait()
+            if process.returncode != 0:
+                if total_bytes == 0:
+                    raise Exception(f"ไม่สามารถแยกเสียงจากวิดีโอได้: {read_stderr()}")
+                message = (
+                    f"ffmpeg หยุดก่อนจบไฟล์ (code {process.returncode}) "
+                    f"transcript อาจไม่ครบ: {read_stderr()}"
+                )
+                logger.warning(message)
+                if warning_callback:
+                    warning_callback(message)
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+            stderr_file.close()
+
+    def _transcribe_stream(
+        self, file_path, progress_callback=None, warning_callback=None, file_key=None
+    ):
+        """ถอดเสียงแบบ streaming ส่งแต่ละช่วงเข้า recognizer ระหว่างถอดรหัส
+
+        ไม่เก็บ PCM ทั้งไฟล์ (วิดีโอยาวมาก) คืน (ข้อความแต่ละส่วน, overlapped)
+        """
+        if progress_callback:
+            progress_callback("🎬 กำลังแยกเสียงและถอดข้อความแบบต่อเนื่อง...")
+
+        windows = self.stream_audio_windows(
+            file_path, warning_callback=warning_callback
+        )
+        if self.preprocess_audio:
+            windows = self.clean_stream_windows(windows)
+
+        overlapped = []
+
+        def segments():
+            # generator: เก็บ overlapped ของแต่ละช่วงระหว่างที่ pool ดึงไปถอด
+            for segment, seam in windows:
+                overlapped.append(seam)
+                yield segment
+
+        chunk_texts = self._transcribe_chunks(
+            segments(), progress_callback, warning_callback, file_key
+        )
+        return chunk_texts, overlapped
+
+    def join_chunks(self, chunk_texts, overlapped=None):
+        """รวมข้อความทุกส่วน รอยต่อที่เสียงเหลื่อมกันจะตัดข้อความที่ซ้ำออก
+
+        overlapped None (เช่น แคชรุ่นเก่า) ถือว่าไม่มีรอยต่อใดเหลื่อมกัน
+        """
+        if overlapped is None:
+            overlapped = [False] * len(chunk_texts)
+        return stitch.stitch_chunks(
+            chunk_texts,
+            overlapped,
+            window_chars=stitch.overlap_window(self.chunk_overlap_ms),
+        )
+
+    def _call_gemini(self, prompt, **kwargs):
+        """เรียก Gemini พร้อม timeout ต่อครั้ง และลองใหม่แบบ backoff + jitter"""
+        for attempt in range(self.llm_retries + 1):
+            try:
+                return self.gemini_model.generate_content(
+                    prompt, request_options={"timeout": self.llm_timeout}, **kwargs
+                )
+            except retryable_gemini_errors():
+                if attempt == self.llm_retries:
+                    raise
+                record = self.metrics.current()
+                if record is not None:
+                    record["retries"] += 1
+                time.sleep(random.uniform(0, min(30.0, 2.0 * 2**attempt)))
+
+    def _generate_content(self, prompt, template, **kwargs):
+        """เรียก Gemini 1 ครั้ง (บันทึกเป็นขั้นตอน gemini ใน metrics)"""
+        with self.metrics.stage(
+            "gemini",
+            bytes_processed=len(prompt.encode("utf-8")),
+            per_thread=True,
+            template=template,
+        ):
+            return self._call_gemini(prompt, **kwargs)
+
+    def _generate_streamed(self, prompt, on_text, template, **kwargs):
+        """เรียก Gemini แบบ stream ส่งข้อความสะสมให้ on_text ทุกครั้งที่ได้ส่วนใหม่"""
+        with self.metrics.stage(
+            "gemini",
+            bytes_processed=len(prompt.encode("utf-8")),
+            per_thread=True,
+            template=template,
+            streamed=True,
+        ) as record:
+            started = time.perf_counter()
+            parts = []
+
+            for chunk in self._call_gemini(prompt, stream=True, **kwargs):
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # chunk ที่ไม่มีข้อความ (เช่น ข้อมูล safety/usage ตอนท้าย)
+                    continue
+                if not text:
+                    continue
+
+                if not parts:
+                    record["ttft_seconds"] = time.perf_counter() - started
+                    logger.info(
+                        "Gemini time-to-first-token: %.2fs", record["ttft_seconds"]
+                    )
+
+                parts.append(text)
+                on_text("".join(parts))
+
+            logger.info(
+                "Gemini stream finished: %.2fs", time.perf_counter() - started
+            )
+            return "".join(parts)
+
+    @staticmethod
+    def _partial_json_string(raw, field):
+        """ดึงค่า string ของ field จาก JSON ที่ยังมาไม่ครบ (ใช้แสดงผลระหว่าง stream)"""
+        marker = raw.find(f'"{field}"')
+        if marker < 0:
+            return ""
+        colon = raw.find(":", marker)
+        start = raw.find('"', colon + 1) if colon >= 0 else -1
+        if start < 0:
+            return ""
+
+        i = start + 1
+        while i < len(raw):
+            if raw[i] == "\\":
+                i += 2
+                continue
+            if raw[i] == '"':
+                break
+            i += 1
+        body = raw[start + 1 : min(i, len(raw))]
+
+        # ตัด escape ที่ยังมาไม่ครบท้ายข้อความออกก่อน decode
+        for cut in range(min(6, len(body)) + 1):
+            try:
+                return json.loads(f'"{body[: len(body) - cut]}"')
+            except ValueError:
+                continue
+        return ""
+
+    def _run_parallel(self, tasks, progress_callback=None, inline=None):
+        """รันงาน Gemini ที่ไม่ขึ้นต่อกันพร้อมกัน
+
+        tasks คือ list ของ (ชื่อ, ป้ายแสดงผล, ฟังก์ชัน, args) คืน dict ตามชื่อ
+        งานชื่อ inline จะรันใน thread ที่เรียก (เช่น งานที่อัปเดต UI ระหว่าง stream)
+        """
+        if progress_callback:
+            labels = ", ".join(label for _, label, _, _ in tasks)
+            progress_callback(f"✨ กำลังสร้าง {labels} พร้อมกัน...")
+
+        results = {}
+        done = 0
+        with ThreadPoolExecutor(max_workers=len(tasks)) as executor:
+            futures = {
+                executor.submit(func, *args): (name, label)
+                for name, label, func, args in tasks
+                if name != inline
+            }
+
+            for name, label, func, args in tasks:
+                if name == inline:
+                    results[name] = func(*args)
+                    done += 1
+                    if progress_callback:
+                        progress_callback(f"✅ {label} เสร็จแล้ว ({done}/{len(tasks)})")
+
+            for future in as_completed(futures):
+                name, label = futures[future]
+                results[name] = future.result()
+                done += 1
+
+                if progress_callback:
+                    progress_callback(f"✅ {label} เสร็จแล้ว ({done}/{len(tasks)})")
+
+        return results
+
+    def _llm_cache_key(self, template, transcript, **params):
+        """key = model + เวอร์ชัน prompt + hash ของ transcript ที่ normalize แล้ว"""
+        normalized = " ".join(transcript.split())
+        transcript_hash = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+        return DiskCache.make_key(
+            self.model_name,
+            template,
+            PROMPT_VERSIONS[template],
+            transcript_hash,
+            params,
+        )
+
+    def _llm_cache_get(self, cache_key):
+        if self.llm_cache is None:
+            return None
+        return self.llm_cache.get(cache_key)
+
+    def _llm_cache_set(self, cache_key, value):
+        if self.llm_cache is not None:
+            self.llm_cache.set(cache_key, value)
+
+    def create_dhamma_post(
+        self, transcript, category="ธรรมะ", progress_callback=None, on_token=None
+    ):
+        """สร้างโพสต์ธรรมะด้วย Gemini (ถ้ามี on_token จะ stream ข้อความสะสมออกมา)"""
+        if progress_callback:
+            progress_callback("✨ กำลังวิเคราะห์และสร้างโพสต์...")
+
+        cache_key = self._llm_cache_key("post", transcript, category=category)
+        cached = self._llm_cache_get(cache_key)
+        if cached is not None:
+            if on_token:
+                on_token(cached)
+            return cached
+
+        prompt = f"""
+คุณเป็นผู้เชี่ยวชาญในการสร้างเนื้อหาธรรมะสำหรับ Social Media
+
+จากเนื้อหาการสอนธรรมะต่อไปนี้:
+{transcript}
+
+กรุณาสร้าง social media post ที่:
+1. เริ่มต้นด้วย hook ที่ดึงดูดความสนใจและสัมผัสใจ
+2. สรุปเนื้อหาธรรมะให้กระชับ เข้าใจง่าย และมีคุณค่า
+3. ใช้น้ำเสียงที่อบอุ่น เป็นกันเอง แต่สื่อถึงความลึกซึ้งของธรรมะ
+4. ใช้ emoji ที่เหมาะสม 2-3 ตัว (เช่น 🙏 ✨ 💫 🌟 ☸️)
+5. จบด้วย call-to-action หรือคำถามเพื่อกระตุ้นการไตร่ตรอง
+6. ใส่ hashtags ที่เกี่ยวข้องกับธรรมะ 5-8 อัน
+
+หมวดหมู่: {category}
+น้ำเสียง: สอนธรรมะ อบอุ่น สร้างแรงบันดาลใจ
+
+รูปแบบ:
+[Hook ที่สัมผัสใจ]
+
+[เนื้อหาธรรมะที่กระชับและลึกซึ้ง 2-3 ประโยค]
+
+[Call-to-action หรือคำถามเพื่อให้ไตร่ตรอง]
+
+#hashtag1 #hashtag2 #hashtag3 ...
+
+กรุณาสร้างโพสต์ที่สวยงาม เหมาะสำหรับโพสต์บน Facebook, Instagram, หรือ Line
+"""
+
+        try:
+            if on_token:
+                post = self._generate_streamed(prompt, on_token, "post").strip()
+            else:
+                post = self._generate_content(prompt, "post").text.strip()
+            self._llm_cache_set(cache_key, post)
+            return post
+        except Exception as e:
+            raise Exception(f"ไม่สามารถสร้างโพสต์ได้: {e}")
+
+    def create_dhamma_essence(self, transcript, progress_callback=None):
+        """สร้างแก่นธรรม 3 ข้อ และ Headline"""
+        if progress_callback:
+            progress_callback("📝 กำลังสร้างแก่นธรรม 3 ข้อ...")
+
+        cache_key = self._llm_cache_key("essence", transcript)
+        cached = self._llm_cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        prompt = f"""
+จากเนื้อหาธรรมะนี้ ช่วยสรุปเป็น "แก่นธรรม 3 ข้อ"
+เพื่อนำไปทำภาพกราฟิกแบบ Checklist หรือ Carousel
+ขอภาษาที่กระชับ อ่านง่าย เหมือนสรุป Key Takeaway ให้คนอ่าน
+และขอ "พาดหัวเรื่อง" (Headline) ที่น่าสนใจสำหรับโพสต์นี้ด้วย 1 ชื่อ
+
+เนื้อหา:
+{transcript}
+
+กรุณาตอบในรูปแบบ JSON:
+{{
+    "headline": "พาดหัวที่น่าสนใจ",
+    "essence_1": "แก่นธรรมข้อที่ 1",
+    "essence_2": "แก่นธรรมข้อที่ 2",
+    "essence_3": "แก่นธรรมข้อที่ 3",
+    "quote": "คำคมสั้นๆ ที่สรุปใจความสำคัญ"
+}}
+
+เงื่อนไข:
+- Headline: ไม่เกิน 60 ตัวอักษร น่าสนใจ ดึงดูดใจ
+- แก่นธรรมแต่ละข้อ: ไม่เกิน 100 ตัวอักษร กระชับ ชัดเจน
+- Quote: ไม่เกิน 150 ตัวอักษร สั้น กระทบใจ จดจำง่าย
+"""
+
+        try:
+            response = self._generate_content(prompt, "essence")
+            result = self._parse_json_response(response.text)
+            self._llm_cache_set(cache_key, result)
+            return result
+        except Exception as e:
+            return {
+                "headline": "หลักธรรมะสำคัญที่ควรรู้",
+                "essence_1": "การฝึกสติในชีวิตประจำวัน",
+                "essence_2": "การปล่อยวางความยึดติด",
+                "essence_3": "การพัฒนาปัญญาเพื่อเข้าใจความจริง",
+                "quote": "ความสุขที่แท้จริงเกิดจากภายใน ไม่ใช่สิ่งภายนอก",
+            }
+
+    def extract_keywords(self, transcript, progress_callback=None):
+        """สกัด keywords จากเนื้อหา"""
+        if progress_callback:
+            progress_callback("🔍 กำลังสกัด keywords...")
+
+        cache_key = self._llm_cache_key("keywords", transcript)
+        cached = self._llm_cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        prompt = f"""
+วิเคราะห์เนื้อหาธรรมะต่อไปนี้และสกัด 5-8 keywords ที่สำคัญ:
+
+{transcript}
+
+กรุณาตอบในรูปแบบ JSON:
+{{
+    "keywords": ["keyword1", "keyword2", ...],
+    "main_teaching": "หลักธรรมะหลักที่สอน",
+    "emotion": "อารมณ์/ความรู้สึกที่ต้องการสื่อ"
+}}
+
+keywords ควรเป็น:
+- คำภาษาไทยที่เกี่ยวกับธรรมะ
+- เหมาะสำหรับทำ hashtag
+- สั้น กระชับ มีความหมาย
+"""
+
+        try:
+            response = self._generate_content(prompt, "keywords")
+            result = self._parse_json_response(response.text)
+            self._llm_cache_set(cache_key, result)
+            return result
+        except Exception as e:
+            return {
+                "keywords": ["ธรรมะ", "สติ", "ปัญญา", "สันติสุข"],
+                "main_teaching": "การปฏิบัติธรรม",
+                "emotion": "สงบ สะเทือนใจ",
+            }
+
+    def recognition_settings(self):
+        """ค่าที่มีผลต่อ transcript (ใช้เป็นส่วนหนึ่งของ key แคช)"""
+        return {
+            **self.asr.settings(),
+            "sample_rate": DecodedAudio.SAMPLE_RATE,
+            "chunking": (
+                f"{'vad' if self.preprocess_audio else 'pauses'}-"
+                f"{self.chunk_target_ms}-{self.chunk_max_ms}-{self.chunk_overlap_ms}"
+            ),
+            "stream_video": self.stream_video,
+        }
+
+    def _transcribe_file(
+        self,
+        file_path,
+        progress_callback=None,
+        warning_callback=None,
+        file_key=None,
+        media_info=None,
+    ):
+        """ถอดเสียงทั้งไฟล์ คืน (ข้อความแต่ละส่วน, overlapped, ความยาววินาที)
+
+        เลือกเส้นทางจาก media_info (ffprobe) ไม่ต้องถอดรหัสก่อนเพื่อดูความยาว
+        """
+        if media_info is None:
+            media_info = self.probe_media(file_path)
+        duration = media_info["duration"]
+
+        if media_info["has_video"] and self.stream_video:
+            chunk_texts, overlapped = self._transcribe_stream(
+                file_path, progress_callback, warning_callback, file_key
+            )
+            return chunk_texts, overlapped, duration
+
+        # ถอดรหัสครั้งเดียว ทุกขั้นตอนใช้ PCM ชุดเดียวกัน
+        audio = self.decode_audio(file_path, progress_callback, media_info)
+
+        if audio.duration <= 60:
+            text = self.speech_to_text_short(audio, progress_callback)
+            return [text], [False], audio.duration
+
+        chunk_texts, overlapped = self._transcribe_decoded(
+            audio, progress_callback, warning_callback, file_key
+        )
+        return chunk_texts, overlapped, audio.duration
+
+    def process_file(
+        self,
+        file_path,
+        category="ธรรมะ",
+        progress_callback=None,
+        file_hash=None,
+        warning_callback=None,
+    ):
+        """ประมวลผลไฟล์ (เสียงหรือวิดีโอ) ผลลัพธ์มี "metrics" ของแต่ละขั้นตอนด้วย"""
+        self.metrics.reset()
+        with self.metrics.stage(
+            "transcription", bytes_processed=os.path.getsize(file_path)
+        ):
+            result = self._process_file(
+                file_path, progress_callback, file_hash, warning_callback
+            )
+        result["metrics"] = list(self.metrics.records)
+        return result
+
+    def _process_file(
+        self, file_path, progress_callback=None, file_hash=None, warning_callback=None
+    ):
+        start_time = time.time()
+        cache_key = None
+        cached = None
+
+        # ตรวจไฟล์จาก header ก่อน: ไฟล์ไม่มีเสียง/สั้นเกินไปถูกปฏิเสธทันที
+        media_info = self.probe_media(file_path)
+        self.validate_media(media_info)
+
+        if self.transcript_cache is not None or self.checkpoint_store is not None:
+            cache_key = DiskCache.make_key(
+                file_hash or file_sha256(file_path), self.recognition_settings()
+            )
+        if self.transcript_cache is not None:
+            cached = self.transcript_cache.get(cache_key)
+
+        if cached:
+            if progress_callback:
+                progress_callback("⚡ พบ transcript ของไฟล์นี้ในแคช")
+            chunk_texts = cached["chunks"]
+            overlapped = cached.get("overlapped")
+            duration = cached["duration"]
+        else:
+            skipped = []
+
+            def on_skip(message):
+                skipped.append(message)
+                if warning_callback:
+                    warning_callback(message)
+
+            chunk_texts, overlapped, duration = self._transcribe_file(
+                file_path, progress_callback, on_skip, cache_key, media_info
+            )
+
+        transcript = self.join_chunks(chunk_texts, overlapped)
+
+        if not transcript or len(transcript.strip()) < 20:
+            raise Exception("ข้อความที่ได้สั้นเกินไป กรุณาตรวจสอบไฟล์")
+
+        # transcript ที่มีส่วนขาดหายไม่เก็บแคช และเก็บ checkpoint ไว้ให้ครั้งหน้าถอดต่อ
+        if not cached and not skipped:
+            if self.transcript_cache is not None:
+                self.transcript_cache.set(
+                    cache_key,
+                    {
+                        "transcript": transcript,
+                        "chunks": chunk_texts,
+                        "overlapped": overlapped,
+                        "duration": duration,
+                    },
+                )
+            if self.checkpoint_store is not None:
+                self.checkpoint_store.clear(cache_key)
+
+        return {
+            "transcript": transcript,
+            "duration": duration,
+            "was_video": media_info["has_video"],
+            "start_time": start_time,
+            "from_cache": bool(cached),
+        }
+
+    @staticmethod
+    def _parse_json_response(response_text):
+        response_text = (
+            response_text.strip().replace("```json", "").replace("```", "").strip()
+        )
+        return json.loads(response_text)
+
+    @staticmethod
+    def validate_combined_result(result):
+        """ตรวจ schema ของผลลัพธ์รวม ถ้าไม่ถูกต้องจะ raise ValueError"""
+        if not isinstance(result, dict):
+            raise ValueError("ผลลัพธ์ไม่ใช่ JSON object")
+
+        for field in COMBINED_TEXT_FIELDS:
+            value = result.get(field)
+            if not isinstance(value, str) or not value.strip():
+                raise ValueError(f"ฟิลด์ '{field}' ไม่มีหรือไม่ใช่ข้อความ")
+
+        keywords = result.get("keywords")
+        if (
+            not isinstance(keywords, list)
+            or not keywords
+            or not all(isinstance(kw, str) and kw.strip() for kw in keywords)
+        ):
+            raise ValueError("ฟิลด์ 'keywords' ต้องเป็น list ของข้อความ")
+
+        cleaned = {field: result[field].strip() for field in COMBINED_TEXT_FIELDS}
+        cleaned["keywords"] = [kw.strip().lstrip("#") for kw in keywords]
+        return cleaned
+
+    def create_all_content(
+        self, transcript, category="ธรรมะ", progress_callback=None, on_post_token=None
+    ):
+        """สร้างโพสต์ keywords และแก่นธรรม ด้วยการเรียก Gemini ครั้งเดียว
+
+        ถ้ามี on_post_token จะ stream ค่า "post" ที่ได้มาแล้วระหว่างรอ JSON ครบ
+        """
+        if progress_callback:
+            progress_callback("✨ กำลังวิเคราะห์และสร้างโพสต์ แก่นธรรม และ keywords...")
+
+        cache_key = self._llm_cache_key("combined", transcript, category=category)
+        cached = self._llm_cache_get(cache_key)
+        if cached is not None:
+            if on_post_token:
+                on_post_token(cached["post"])
+            return cached
+
+        prompt = f"""
+คุณเป็นผู้เชี่ยวชาญในการสร้างเนื้อหาธรรมะสำหรับ Social Media
+
+จากเนื้อหาการสอนธรรมะต่อไปนี้:
+{transcript}
+
+หมวดหมู่: {category}
+
+กรุณาตอบเป็น JSON object เดียวในรูปแบบนี้ (ให้ "post" เป็นฟิลด์แรก):
+{{
+    "post": "social media post",
+    "keywords": ["keyword1", "keyword2", ...],
+    "main_teaching": "หลักธรรมะหลักที่สอน",
+    "emotion": "อารมณ์/ความรู้สึกที่ต้องการสื่อ",
+    "headline": "พาดหัวที่น่าสนใจ",
+    "essence_1": "แก่นธรรมข้อที่ 1",
+    "essence_2": "แก่นธรรมข้อที่ 2",
+    "essence_3": "แก่นธรรมข้อที่ 3",
+    "quote": "คำคมสั้นๆ ที่สรุปใจความสำคัญ"
+}}
+
+post:
+1. เริ่มต้นด้วย hook ที่ดึงดูดความสนใจและสัมผัสใจ
+2. สรุปเนื้อหาธรรมะให้กระชับ เข้าใจง่าย และมีคุณค่า 2-3 ประโยค
+3. ใช้น้ำเสียงที่อบอุ่น เป็นกันเอง แต่สื่อถึงความลึกซึ้งของธรรมะ
+4. ใช้ emoji ที่เหมาะสม 2-3 ตัว (เช่น 🙏 ✨ 💫 🌟 ☸️)
+5. จบด้วย call-to-action หรือคำถามเพื่อกระตุ้นการไตร่ตรอง
+6. ใส่ hashtags ที่เกี่ยวข้องกับธรรมะ 5-8 อัน ในบรรทัดสุดท้าย
+7. ขึ้นบรรทัดใหม่ระหว่างย่อหน้าด้วย \n เหมาะสำหรับ Facebook, Instagram, หรือ Line
+
+keywords: 5-8 คำภาษาไทยที่เกี่ยวกับธรรมะ สั้น กระชับ เหมาะสำหรับทำ hashtag
+
+เงื่อนไข:
+- Headline: ไม่เกิน 60 ตัวอักษร น่าสนใจ ดึงดูดใจ
+- แก่นธรรมแต่ละข้อ: ไม่เกิน 100 ตัวอักษร กระชับ ชัดเจน เหมือนสรุป Key Takeaway
+- Quote: ไม่เกิน 150 ตัวอักษร สั้น กระทบใจ จดจำง่าย
+"""
+
+        try:
+            generation_config = {"response_mime_type": "application/json"}
+            if on_post_token:
+                response_text = self._generate_streamed(
+                    prompt,
+                    lambda raw: on_post_token(self._partial_json_string(raw, "post")),
+                    "combined",
+                    generation_config=generation_config,
+                )
+            else:
+                response_text = self._generate_content(
+                    prompt, "combined", generation_config=generation_config
+                ).text
+        except Exception as e:
+            raise Exception(f"ไม่สามารถสร้างเนื้อหาแบบรวมได้: {e}")
+
+        # JSON เสียหรือไม่ผ่าน schema: raise ValueError ให้ผู้เรียกเลือกเรียกแยกแทน
+        try:
+            result = self.validate_combined_result(
+                self._parse_json_response(response_text)
+            )
+        except ValueError as e:
+            raise ValueError(f"ผลลัพธ์แบบรวมไม่ถูกต้อง: {e}")
+
+        self._llm_cache_set(cache_key, result)
+        return result
+
+    @staticmethod
+    def split_transcript_windows(transcript, window_chars):
+        """แบ่ง transcript เป็นช่วงละไม่เกิน window_chars ตัวอักษร
+
+        ตัดที่ขึ้นบรรทัดใหม่หรือช่องว่างที่ใกล้ขอบช่วงที่สุด (ในครึ่งหลังของช่วง)
+        ข้อความจาก ASR ภาษาไทยมักแทบไม่มีช่องว่าง ถ้าไม่พบจึงตัดที่ window_chars ตรงๆ
+        """
+        text = transcript.strip()
+        windows = []
+        start = 0
+        while start < len(text):
+            end = start + window_chars
+            if end >= len(text):
+                cut = next_start = len(text)
+            else:
+                low = start + window_chars // 2
+                cut = text.rfind("\n", low, end + 1)
+                if cut < 0:
+                    cut = text.rfind(" ", low, end + 1)
+                if cut < 0:
+                    cut = next_start = end
+                else:
+                    next_start = cut + 1
+
+            window = text[start:cut].strip()
+            if window:
+                windows.append(window)
+            start = next_start
+        return windows
+
+    def summarize_window(self, window):
+        """สรุป transcript 1 ช่วง (ขั้น map) ผลลัพธ์ถูกแคชตามเนื้อหาช่วงนั้น"""
+        cache_key = self._llm_cache_key("window_summary", window)
+        cached = self._llm_cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        prompt = f"""
+นี่คือส่วนหนึ่งของการบรรยายธรรมะที่ยาวมาก:
+
+{window}
+
+กรุณาสรุปส่วนนี้ให้กระชับ โดยเก็บ:
+- หลักธรรมที่สอนในส่วนนี้
+- ตัวอย่างหรือเรื่องเล่าที่ใช้ประกอบ (สั้นๆ)
+- ประโยคเด่นที่ควรยกมาอ้างอิง (คงถ้อยคำเดิม)
+
+ตอบเป็นข้อความภาษาไทย ไม่เกิน 12 บรรทัด ไม่ต้องมีคำนำหรือคำลงท้าย
+"""
+
+        try:
+            summary = self._generate_content(prompt, "window_summary").text.strip()
+        except Exception:
+            # สรุปไม่ได้: ใช้เนื้อหาเดิมของช่วงนั้นแทน เพื่อไม่ให้เนื้อหาหาย
+            return window
+
+        self._llm_cache_set(cache_key, summary)
+        return summary
+
+    def condense_transcript(self, transcript, progress_callback=None):
+        """ย่อ transcript ยาวมากแบบ map-reduce
+
+        สรุปแต่ละช่วงพร้อมกัน (map) แล้วคืนสรุปรวมไว้ใช้แทน transcript ในขั้น reduce
+        transcript ที่ไม่ยาวเกิน map_reduce_threshold_chars จะคืนค่าเดิม
+        """
+        if len(transcript) <= self.map_reduce_threshold_chars:
+            return transcript
+
+        windows = self.split_transcript_windows(
+            transcript, self.map_reduce_window_chars
+        )
+        if progress_callback:
+            progress_callback(
+                f"📚 เนื้อหายาวมาก กำลังสรุปทีละช่วง ({len(windows)} ช่วง)..."
+            )
+
+        summaries = [None] * len(windows)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                executor.submit(self.summarize_window, window): i
+                for i, window in enumerate(windows)
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                summaries[futures[future]] = future.result()
+                if progress_callback:
+                    progress_callback(f"📚 สรุปแล้ว {done}/{len(windows)} ช่วง")
+
+        return "\n\n".join(
+            f"[ช่วงที่ {i}] {summary}" for i, summary in enumerate(summaries, 1)
+        )
+
+    def continue_processing(
+        self, transcript, category, progress_callback=None, on_post_token=None
+    ):
+        """ประมวลผลต่อหลังจากแสดง transcript แล้ว
+
+        on_post_token ถูกเรียกจาก thread ที่เรียกฟังก์ชันนี้เท่านั้น จึงอัปเดต UI ได้
+        ผลลัพธ์มี "metrics" ของแต่ละขั้นตอนด้วย
+        """
+        self.metrics.reset()
+        with self.metrics.stage(
+            "generation", bytes_processed=len(transcript.encode("utf-8"))
+        ):
+            result = dict(
+                self._continue_processing(
+                    transcript, category, progress_callback, on_post_token
+                )
+            )
+        result["metrics"] = list(self.metrics.records)
+        return result
+
+    def _continue_processing(
+        self, transcript, category, progress_callback=None, on_post_token=None
+    ):
+        # transcript หลายชั่วโมง: ใช้สรุปรายช่วงแทน (สรุปถูกแคชแยกจากหมวดหมู่)
+        transcript = self.condense_transcript(transcript, progress_callback)
+
+        if self.combined_generation:
+            try:
+                return self.create_all_content(
+                    transcript, category, progress_callback, on_post_token
+                )
+            except ValueError:
+                # JSON ไม่ผ่าน schema: ย้อนกลับไปเรียกแยก 3 ครั้งแบบเดิม
+                # (ข้อผิดพลาดจาก API เช่นโควตาหมดหรือ timeout ส่งต่อให้ผู้เรียก)
+                if progress_callback:
+                    progress_callback("↩️ สร้างแบบรวมไม่สำเร็จ กำลังสร้างแยกทีละส่วน...")
+
+        # 3 ขั้นตอนไม่ขึ้นต่อกัน จึงเรียกพร้อมกัน
+        results = self._run_parallel(
+            [
+                ("keywords", "keywords", self.extract_keywords, (transcript,)),
+                (
+                    "post",
+                    "โพสต์",
+                    self.create_dhamma_post,
+                    (transcript, category, None, on_post_token),
+                ),
+                (
+                    "essence",
+                    "แก่นธรรม 3 ข้อ",
+                    self.create_dhamma_essence,
+                    (transcript,),
+                ),
+            ],
+            progress_callback,
+            inline="post" if on_post_token else None,
+        )
+        analysis = results["keywords"]
+        post = results["post"]
+        essence = results["essence"]
+
+        return {
+            "post": post,
+            "keywords": analysis.get("keywords", []),
+            "main_teaching": analysis.get("main_teaching", ""),
+            "emotion": analysis.get("emotion", ""),
+            "headline": essence.get("headline", ""),
+            "essence_1": essence.get("essence_1", ""),
+            "essence_2": essence.get("essence_2", ""),
+            "essence_3": essence.get("essence_3", ""),
+            "quote": essence.get("quote", ""),
+        }
@@ -0,0 +1,65 @@
+"""
+stitch.py - ต่อข้อความของส่วนที่ตัดเสียงแบบเหลื่อมกัน (overlap) โดยไม่ให้คำซ้ำ
+
+เมื่อส่วนที่ติดกันมีเสียงช่วงเดียวกันอยู่ท้ายส่วนแรกและต้นส่วนถัดไป
+ข้อความตรงนั้นจะซ้ำกัน หา substring ร่วมที่ยาวที่สุดระหว่างท้ายข้อความแรก
+กับต้นข้อความถัดไป (เทียบทีละตัวอักษร เพราะภาษาไทยไม่เว้นวรรคระหว่างคำ)
+แล้วต่อตรงจุดนั้น คำที่ถูกตัดครึ่งที่ขอบทั้งสองด้านจึงถูกทิ้งไปด้วย
+
+ต่อแบบนี้เฉพาะรอยต่อที่เสียงเหลื่อมกันจริง (ตัดกลางเสียงพูด) เท่านั้น
+รอยต่ออื่นคั่นด้วยช่องว่าง เพราะประโยคที่ต่างกันอาจมีวลีเดียวกันได้
+"""
+
+import difflib
+
+# อัตราพูดภาษาไทยราว 10-15 ตัวอักษร/วินาที เผื่อคำที่ถูกตัดครึ่งที่ขอบ
+CHARS_PER_SECOND = 20
+MIN_MATCH = 6
+
+
+def overlap_window(overlap_ms, min_match=MIN_MATCH):
+    """จำนวนตัวอักษรท้าย/ต้นข้อความที่อาจเป็นเสียงช่วงเหลื่อม"""
+    return max(2 * min_match, overlap_ms * CHARS_PER_SECOND // 1000)
+
+
+def merge_overlap(left, right, window_chars=40, min_match=MIN_MATCH):
+    """ต่อ left กับ right ถ้าพบข้อความซ้ำช่วงรอยต่อ ไม่เช่นนั้นคั่นด้วยช่องว่าง
+
+    ข้อความซ้ำต้องอยู่ใน window_chars ตัวท้ายของ left และ window_chars ตัวแรก
+    ของ right (ประมาณความยาวช่วงเหลื่อม) ข้อความที่ถูกทิ้งจึงไม่เกินช่วงนั้น
+    """
+    if not left:
+        return right
+    if not right:
+        return left
+
+    tail = left[-window_chars:]
+    head = right[:window_chars]
+    matcher = difflib.SequenceMatcher(None, tail, head, autojunk=False)
+    match = matcher.find_longest_match(0, len(tail), 0, len(head))
+    if match.size < min_match or not tail[match.a : match.a + match.size].strip():
+        return f"{left} {right}"
+
+    cut_left = len(left) - len(tail) + match.a + match.size
+    return left[:cut_left] + right[match.b + match.size :]
+
+
+def stitch_chunks(chunk_texts, overlapped=None, window_chars=40, min_match=MIN_MATCH):
+    """ต่อข้อความทุกส่วนตามลำดับ (ส่วนที่เป็น None หรือว่างถูกข้าม)
+
+    overlapped[i] = ส่วนที่ i เริ่มด้วยเสียงซ้ำกับท้ายส่วนที่ i-1
+    (None = ทุกรอยต่อเหลื่อมกัน) ถ้าส่วนก่อนหน้าไม่มีข้อความ จะไม่มีอะไรให้ต่อ
+    """
+    transcript = ""
+    previous_text = False
+    for i, text in enumerate(chunk_texts):
+        if text:
+            seam = overlapped is None or overlapped[i]
+            if seam and previous_text:
+                transcript = merge_overlap(transcript, text, window_chars, min_match)
+            elif transcript:
+                transcript = f"{transcript} {text}"
+            else:
+                transcript = text
+        previous_text = bool(text)
+    return transcript
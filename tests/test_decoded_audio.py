@@ -0,0 +1,73 @@
+import struct
+import types
+import wave
+
+import processor
+from processor import DecodedAudio
+
+NATIVE_INFO = {
+    "format": "wav",
+    "has_video": False,
+    "audio_codec": "pcm_s16le",
+    "sample_rate": 16000,
+    "channels": 1,
+}
+PCM = b"\x01\x00" * 16000
+
+
+def fake_ffmpeg(calls):
+    class Stream:
+        def output(self, *args, **kwargs):
+            return self
+
+        def run(self, **kwargs):
+            calls.append("ffmpeg")
+            return PCM, b""
+
+    return types.SimpleNamespace(input=lambda path: Stream(), Error=RuntimeError)
+
+
+def write_extensible_wav(path):
+    # WAVE_FORMAT_EXTENSIBLE (0xFFFE) + sub-format KSDATAFORMAT_SUBTYPE_PCM
+    fmt = struct.pack(
+        "<HHIIHHHHI16s",
+        0xFFFE,
+        1,
+        16000,
+        32000,
+        2,
+        16,
+        22,
+        16,
+        4,
+        bytes.fromhex("0100000000001000800000aa00389b71"),
+    )
+    body = b"WAVE" + b"fmt " + struct.pack("<I", len(fmt)) + fmt
+    body += b"data" + struct.pack("<I", len(PCM)) + PCM
+    path.write_bytes(b"RIFF" + struct.pack("<I", len(body)) + body)
+
+
+def test_native_wav_is_read_directly(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(processor, "ffmpeg", fake_ffmpeg(calls))
+    path = tmp_path / "native.wav"
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(16000)
+        f.writeframes(PCM)
+
+    audio = DecodedAudio.from_file(str(path), NATIVE_INFO)
+    assert audio.pcm == PCM
+    assert calls == []
+
+
+def test_extensible_wav_falls_back_to_ffmpeg(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(processor, "ffmpeg", fake_ffmpeg(calls))
+    path = tmp_path / "extensible.wav"
+    write_extensible_wav(path)
+
+    audio = DecodedAudio.from_file(str(path), NATIVE_INFO)
+    assert audio.duration == 1.0
+    assert calls == ["ffmpeg"]
@@ -0,0 +1,90 @@
+import pytest
+
+from library import TalkLibrary
+
+
+def make_record(transcript, **fields):
+    record = {
+        "transcript": transcript,
+        "headline": "การเจริญสติในชีวิตประจำวัน",
+        "main_teaching": "สติปัฏฐาน 4",
+        "keywords": ["สติ", "สมาธิ"],
+        "essence_1": "รู้ตัวทั่วพร้อม",
+        "essence_2": "ไม่ยึดติด",
+        "essence_3": "ปล่อยวาง",
+        "quote": "ใจที่สงบคือบ้านที่แท้จริง",
+        "post": "โพสต์ธรรมะ",
+        "duration": 600.0,
+        "was_video": True,
+    }
+    record.update(fields)
+    return record
+
+
+@pytest.fixture
+def library(tmp_path):
+    return TalkLibrary(str(tmp_path / "library.sqlite3"))
+
+
+def test_add_and_get_round_trip(library):
+    talk_id = library.add(make_record("ถอดเสียงครั้งที่หนึ่ง"), "a.mp3", "ธรรมะ")
+    record = library.get(talk_id)
+    assert record["file_name"] == "a.mp3"
+    assert record["category"] == "ธรรมะ"
+    assert record["keywords"] == ["สติ", "สมาธิ"]
+    assert [record[f"essence_{i}"] for i in (1, 2, 3)] == [
+        "รู้ตัวทั่วพร้อม",
+        "ไม่ยึดติด",
+        "ปล่อยวาง",
+    ]
+    assert record["was_video"] is True
+
+
+def test_empty_or_multiline_essences_keep_their_position(library):
+    talk_id = library.add(
+        make_record(
+            "ถอดเสียงครั้งที่สอง", essence_1="บรรทัดแรก\nบรรทัดสอง", essence_2=""
+        )
+    )
+    record = library.get(talk_id)
+    assert record["essence_1"] == "บรรทัดแรก\nบรรทัดสอง"
+    assert record["essence_2"] == ""
+    assert record["essence_3"] == "ปล่อยวาง"
+
+
+def test_same_transcript_replaces_entry(library):
+    first = library.add(make_record("ถอดเสียงเดิม", headline="หัวข้อเก่า"))
+    second = library.add(make_record("ถอดเสียงเดิม", headline="หัวข้อใหม่"))
+    assert first == second
+    assert library.count() == 1
+    assert library.search("หัวข้อเก่า") == []
+    assert [talk["id"] for talk in library.search("หัวข้อใหม่")] == [first]
+
+
+def test_search_ranks_headline_before_body(library):
+    in_body = library.add(
+        make_record("พูดเรื่องอานาปานสติยาวๆ", headline="ธรรมะทั่วไป", post="")
+    )
+    in_headline = library.add(
+        make_record("ถอดเสียงอีกไฟล์", headline="อานาปานสติเบื้องต้น")
+    )
+    results = library.search("อานาปานสติ")
+    assert [talk["id"] for talk in results] == [in_headline, in_body]
+    assert "**" in results[0]["snippet"]
+
+
+def test_search_short_terms_and_category(library):
+    talk_id = library.add(make_record("ถอดเสียงหมวด", quote="ศีล"), category="ศีล")
+    library.add(make_record("ถอดเสียงหมวดอื่น"), category="สมาธิ")
+    assert [talk["id"] for talk in library.search("ศีล", category="ศีล")] == [
+        talk_id
+    ]
+    assert library.search("ศีล", category="สมาธิ") == []
+    assert library.search("   ") == []
+
+
+def test_delete(library):
+    talk_id = library.add(make_record("ถอดเสียงที่จะลบ"))
+    library.delete(talk_id)
+    assert library.get(talk_id) is None
+    assert library.search("ที่จะลบ") == []
@@ -0,0 +1,85 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from preprocess import (  # noqa: E402
+    VAD_FALLBACK_FRAMES,
+    estimate_noise_floor,
+    frame_energy_db,
+    plan_chunks,
+    speech_is_plausible,
+    speech_regions,
+)
+
+
+def flat_energy(frames):
+    return np.full(frames, -20.0, dtype=np.float32)
+
+
+def test_separate_regions_do_not_overlap():
+    regions = [(0, 400), (500, 900), (1000, 1400)]
+    groups, overlapped = plan_chunks(
+        regions, flat_energy(1400), 1000, 1500, 250, overlap_frames=100
+    )
+    assert len(groups) == len(overlapped)
+    assert not any(overlapped)
+
+
+def test_long_region_is_cut_with_overlap():
+    energy = flat_energy(3000)
+    groups, overlapped = plan_chunks(
+        [(0, 3000)], energy, 1000, 1500, 250, overlap_frames=100
+    )
+    assert overlapped[0] is False
+    assert all(overlapped[1:])
+    for previous, group in zip(groups, groups[1:]):
+        assert group[0][0] == previous[-1][1] - 100
+
+
+def test_short_continued_piece_is_not_merged_back():
+    # ชิ้นสุดท้ายสั้นกว่า min_frames แต่เหลื่อมกับชิ้นก่อนหน้า ต้องเป็นส่วนแยก
+    groups, overlapped = plan_chunks(
+        [(0, 1600)], flat_energy(1600), 1000, 1500, 700, overlap_frames=100
+    )
+    assert len(groups) == 2
+    assert overlapped == [False, True]
+    assert groups[1] == [(groups[0][0][1] - 100, 1600)]
+
+
+def test_no_overlap_requested():
+    groups, overlapped = plan_chunks(
+        [(0, 3000)], flat_energy(3000), 1000, 1500, 250, overlap_frames=0
+    )
+    assert not any(overlapped)
+    assert sum(end - start for group in groups for start, end in group) == 3000
+
+
+def test_speech_regions_finds_loud_frames():
+    energy = np.full(300, -60.0)
+    energy[100:200] = -20.0
+    assert speech_regions(energy, -60.0, pad_frames=0) == [(100, 200)]
+
+
+def test_vad_on_continuous_noise_is_implausible():
+    # พูดต่อเนื่องบนเสียงรบกวนระดับเดียวกัน เงียบจริงแค่ 10 จาก 140 วินาที
+    rng = np.random.default_rng(0)
+    energy = np.concatenate(
+        (rng.normal(-25.0, 1.5, 6500), np.full(500, -80.0))
+    ).astype(np.float32)
+    floor = estimate_noise_floor(energy)
+    regions = speech_regions(energy, floor)
+    speech = sum(end - start for start, end in regions)
+    assert not speech_is_plausible(speech, len(energy))
+
+
+def test_short_audio_is_always_plausible():
+    assert speech_is_plausible(0, VAD_FALLBACK_FRAMES - 1)
+
+
+def test_frame_energy_is_the_same_in_blocks():
+    rng = np.random.default_rng(1)
+    samples = rng.integers(-20000, 20000, 16000 * 7 + 123).astype(np.int16)
+    whole = frame_energy_db(samples, 16000, block_frames=10_000)
+    blocked = frame_energy_db(samples, 16000, block_frames=7)
+    assert len(whole) == 350
+    np.testing.assert_allclose(blocked, whole, rtol=1e-6)
@@ -0,0 +1,36 @@
+from stitch import merge_overlap, overlap_window, stitch_chunks
+
+SENTENCE_A = "เมื่อเรามีสติอยู่กับลมหายใจ ใจก็สงบลง นี่แหละคือความสุขที่แท้จริงของชีวิต"
+SENTENCE_B = "ความสุขที่แท้จริงไม่ได้อยู่ที่ทรัพย์สมบัติ แต่อยู่ที่ใจที่รู้จักพอ"
+
+
+def test_overlapped_seam_removes_duplicate_text():
+    left = "วันนี้เราจะพูดถึงเรื่องการมีสติในชีวิตประจำวัน"
+    right = "สติในชีวิตประจำวันนั้นเริ่มจากการรู้ลมหายใจ"
+    assert stitch_chunks([left, right], [False, True]) == (
+        "วันนี้เราจะพูดถึงเรื่องการมีสติในชีวิตประจำวันนั้นเริ่มจากการรู้ลมหายใจ"
+    )
+
+
+def test_boundary_without_overlap_keeps_all_text():
+    # ประโยคต่างกันที่มีวลีเดียวกัน ต้องไม่ถูกมองว่าเป็นรอยต่อ
+    transcript = stitch_chunks([SENTENCE_A, SENTENCE_B], [False, False])
+    assert transcript == f"{SENTENCE_A} {SENTENCE_B}"
+
+
+def test_shared_phrase_away_from_edges_is_not_a_seam():
+    left = SENTENCE_A + " ขอให้ทุกท่านลองฝึกดูทุกวันนะครับ"
+    right = "วันนี้ขอเล่าเรื่องเก่าสักเรื่อง " + SENTENCE_B
+    merged = merge_overlap(left, right, window_chars=overlap_window(2000))
+    assert merged == f"{left} {right}"
+
+
+def test_missing_chunk_breaks_the_seam():
+    texts = ["ก่อนหน้านี้เราพูดถึงเมตตา", None, "พูดถึงเมตตาต่อตนเองก่อน"]
+    assert stitch_chunks(texts, [False, True, True]) == (
+        "ก่อนหน้านี้เราพูดถึงเมตตา พูดถึงเมตตาต่อตนเองก่อน"
+    )
+
+
+def test_empty_chunks_are_skipped():
+    assert stitch_chunks(["", None, "ธรรมะ"], [False, False, False]) == "ธรรมะ"
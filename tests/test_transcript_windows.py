@@ -0,0 +1,21 @@
+from processor import DhammaPostCreator
+
+split_transcript_windows = DhammaPostCreator.split_transcript_windows
+
+
+def test_unspaced_thai_is_hard_split():
+    windows = split_transcript_windows("ก" * 50000, 12000)
+    assert [len(window) for window in windows] == [12000] * 4 + [2000]
+
+
+def test_prefers_whitespace_near_window_end():
+    transcript = " ".join(["สติปัฏฐาน"] * 3000)
+    windows = split_transcript_windows(transcript, 1000)
+    assert all(len(window) <= 1000 for window in windows)
+    assert " ".join(windows) == transcript
+
+
+def test_prefers_newline_over_space():
+    transcript = "ก" * 600 + "\n" + "ข ข" * 200
+    windows = split_transcript_windows(transcript, 1000)
+    assert windows[0] == "ก" * 600